@@ -1,13 +1,18 @@
+import math
+import secrets
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import Depends, Header, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.requests import Request
 
-from app.core.config import SECRET_KEY, API_PREFIX
+from app.core.config import SECRET_KEY, API_PREFIX, METRICS_TOKEN
 from app.models.user import UserInDB
 from app.api.dependencies.database import get_repository
 from app.db.repositories.users import UsersRepository
 from app.services import auth_service
+from app.services.authentication import authenticated_users_cache
+from app.services.rate_limit import login_limiter_by_email, login_limiter_by_ip
 
 
 # OAuth2PasswordBearer is a class we import from FastAPI
@@ -28,7 +33,14 @@ async def get_user_from_token(
         username = auth_service.get_username_from_token(
             token=token, secret_key=str(SECRET_KEY)
         )
+        if user_repo.reads_cache:
+            user = authenticated_users_cache.get(username)
+            if user:
+                return user.copy()
+
         user = await user_repo.get_user_by_username(username=username)
+        if user and user_repo.fills_cache:
+            authenticated_users_cache.set(username, user)
     except Exception as e:
         raise e
 
@@ -51,3 +63,38 @@ def get_current_active_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     return current_user
+
+
+async def throttle_login_attempts(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(OAuth2PasswordRequestForm),
+) -> None:
+    """
+    Turn away login attempts over the per ip or per email limit before
+    the user is looked up or the password is hashed, so a credential
+    stuffing burst can't tie up the database and bcrypt workers.
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = await login_limiter_by_ip.hit(client_ip)
+    if not retry_after:
+        retry_after = await login_limiter_by_email.hit(form_data.username.lower())
+
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts. Try again later.",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def require_metrics_token(x_metrics_token: str = Header("")) -> None:
+    """
+    Internal counters such as cache hit rates and how often logins get
+    throttled are only for whoever operates the service, so the caller
+    has to present METRICS_TOKEN. With no token configured nobody can.
+    """
+    expected = str(METRICS_TOKEN)
+    if not expected or not secrets.compare_digest(x_metrics_token, expected):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Invalid metrics token."
+        )
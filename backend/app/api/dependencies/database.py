@@ -1,18 +1,113 @@
-from typing import Callable, Type
+import asyncio
+import functools
+import math
+import random
+import time
+from typing import Callable, Optional, Type
 from databases import Database
 
 from fastapi import Depends
 from starlette.requests import Request
+from starlette.responses import Response
 
+from app.core.config import READ_YOUR_WRITES_SECONDS
 from app.db.repositories.base import BaseRepository
+from app.db.unit_of_work import UnitOfWork
+
+# set on responses to requests that may have written, holds the time of
+# the write so later reads from the same client stay on the primary
+LAST_WRITE_COOKIE = "phresh_last_write"
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
 
 
 def get_database(request: Request) -> Database:
     return request.app.state._db
 
 
+def wrote_recently(request: Request) -> bool:
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, ""))
+    except ValueError:
+        return False
+
+    return time.time() - last_write < READ_YOUR_WRITES_SECONDS
+
+
+def get_reader_database(request: Request, response: Response) -> Database:
+    """
+    A random replica for read only queries. Requests that write, and
+    clients that wrote within READ_YOUR_WRITES_SECONDS, read from the
+    primary instead so they never miss their own changes.
+    """
+    replicas = getattr(request.app.state, "_replica_dbs", None)
+    if not replicas:
+        return get_database(request)
+
+    if request.method not in SAFE_METHODS:
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            str(time.time()),
+            max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+            httponly=True,
+        )
+        return get_database(request)
+
+    if wrote_recently(request):
+        return get_database(request)
+
+    return random.choice(replicas)
+
+
+def remaining_budget_ms(request: Request) -> Optional[int]:
+    """
+    What is left of the deadline DeadlineMiddleware gave this request
+    """
+    deadline = getattr(request.state, "deadline", None)
+    if deadline is None:
+        return None
+
+    return int((deadline - asyncio.get_event_loop().time()) * 1000)
+
+
+async def get_unit_of_work(request: Request) -> UnitOfWork:
+    """
+    One connection, and for requests that write one transaction, shared
+    by every repository of the request. It is only checked out by the
+    first query through unit_of_work.db. UnitOfWorkMiddleware commits it
+    on success and rolls it back on errors.
+    """
+    unit_of_work = getattr(request.state, "unit_of_work", None)
+    if unit_of_work is not None:
+        return unit_of_work
+
+    unit_of_work = UnitOfWork(
+        get_database(request),
+        transactional=request.method not in SAFE_METHODS,
+        statement_timeout_ms=functools.partial(remaining_budget_ms, request),
+    )
+    request.state.unit_of_work = unit_of_work
+    return unit_of_work
+
+
 def get_repository(Repo_type: Type[BaseRepository]) -> Callable:
-    def get_repo(db: Database = Depends(get_database)) -> Type[BaseRepository]:
-        return Repo_type(db)
+    def get_repo(
+        request: Request,
+        unit_of_work: UnitOfWork = Depends(get_unit_of_work),
+        reader_db: Database = Depends(get_reader_database),
+    ) -> Type[BaseRepository]:
+        # Read only requests run their primary reads in the unit of work.
+        # Requests that write read on a connection of their own until the
+        # first write begins the transaction, so e.g. a login holds none
+        # while the password hashes. Later reads share the transaction's
+        # connection, databases hands the same one to the whole task.
+        if reader_db is get_database(request) and not unit_of_work.transactional:
+            reader_db = unit_of_work.db
+
+        # the shared caches may hold rows from before this client's
+        # write, possibly made on another worker
+        return Repo_type(
+            unit_of_work.db, reader_db, use_cache=not wrote_recently(request)
+        )
 
     return get_repo
@@ -0,0 +1,199 @@
+import asyncio
+from typing import Dict, Sequence
+
+from asyncpg.exceptions import QueryCanceledError
+from fastapi import status
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import register_metrics
+
+deadline_stats = {"deadline_exceeded": 0, "client_disconnected": 0}
+register_metrics("deadlines", lambda: dict(deadline_stats))
+
+
+def parse_deadline_overrides(overrides: Sequence[str]) -> Dict[str, float]:
+    """
+    ["cleanings:export-cleanings=300", ...] -> {"cleanings:export-cleanings": 300.0}
+    """
+    deadlines = {}
+    for override in overrides:
+        route_name, _, seconds = override.rpartition("=")
+        deadlines[route_name.strip()] = float(seconds)
+
+    return deadlines
+
+
+def deadline_exceeded_response(detail: str) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail}, status_code=status.HTTP_504_GATEWAY_TIMEOUT
+    )
+
+
+async def query_canceled_handler(
+    request: Request, exc: QueryCanceledError
+) -> JSONResponse:
+    # statement_timeout, set from the request deadline, cut a query short
+    deadline_stats["deadline_exceeded"] += 1
+    return deadline_exceeded_response("Request ran out of time in the database.")
+
+
+async def finish_unit_of_work(scope: Scope, *, commit: bool) -> None:
+    unit_of_work = scope.get("state", {}).get("unit_of_work")
+    if unit_of_work is None:
+        return
+
+    if commit:
+        await unit_of_work.commit()
+    else:
+        await unit_of_work.rollback()
+
+
+class UnitOfWorkMiddleware:
+    """
+    Ends the unit of work opened by get_unit_of_work. The transaction is
+    committed just before the response status goes out when it is below
+    400, so the client never hears about a write that is not in the
+    database yet, and rolled back for error responses and exceptions.
+
+    This can't live in the dependency itself: in this FastAPI version the
+    code after a dependency's yield runs once the response has been sent,
+    and never sees HTTPExceptions.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_after_finishing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                await finish_unit_of_work(scope, commit=message["status"] < 400)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_after_finishing)
+        except BaseException:
+            # cancellation by DeadlineMiddleware included, the pinned
+            # connection has to go back to the pool either way
+            await finish_unit_of_work(scope, commit=False)
+            raise
+
+
+class DeadlineMiddleware:
+    """
+    Runs each request against the deadline of its route. The deadline is
+    left in the request state for get_unit_of_work, which turns what is
+    left of it into a statement_timeout.
+
+    The request is cancelled, and its transaction rolled back, when the
+    client disconnects before the response is complete or the deadline
+    passes. In the latter case the
+    client gets a 504 unless the response had already started.
+    """
+
+    def __init__(
+        self, app: ASGIApp, *, default_seconds: float, overrides: Sequence[str]
+    ) -> None:
+        self.app = app
+        self.default_seconds = default_seconds
+        self.overrides = parse_deadline_overrides(overrides)
+
+    def budget_for(self, scope: Scope) -> float:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return self.overrides.get(route.name, self.default_seconds)
+
+        return self.default_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = self.budget_for(scope)
+        loop = asyncio.get_event_loop()
+        scope.setdefault("state", {})["deadline"] = loop.time() + budget
+
+        response_started = False
+        response_complete = False
+
+        async def send_tracking_start(message: Message) -> None:
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body":
+                response_complete = not message.get("more_body", False)
+            await send(message)
+
+        # Read from the server on our own so a disconnect is noticed even
+        # while the app is busy in the database. Other messages reach the
+        # app through a small queue, once it is full reading stops and the
+        # server's flow control holds back the rest of the body.
+        messages: asyncio.Queue = asyncio.Queue(maxsize=1)
+        disconnected = False
+
+        async def watch_for_disconnect() -> None:
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    if not messages.full():
+                        messages.put_nowait(message)
+                    return
+                await messages.put(message)
+
+        async def receive_from_watcher() -> Message:
+            if disconnected and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        deadline = loop.time() + budget
+        request = asyncio.ensure_future(
+            self.app(scope, receive_from_watcher, send_tracking_start)
+        )
+        watcher = asyncio.ensure_future(watch_for_disconnect())
+        try:
+            await asyncio.wait(
+                {request, watcher},
+                timeout=budget,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if watcher.done() and response_complete and not request.done():
+                # Servers report a disconnect once the response has been
+                # sent. That isn't the client leaving, let the request
+                # finish what it still has to do, e.g. background tasks.
+                await asyncio.wait({request}, timeout=max(deadline - loop.time(), 0))
+        except asyncio.CancelledError:
+            request.cancel()
+            raise
+        finally:
+            watcher.cancel()
+
+        if request.done():
+            request.result()
+            return
+
+        request.cancel()
+        try:
+            await request
+        except (asyncio.CancelledError, Exception):
+            pass
+
+        if watcher.done() and not watcher.cancelled() and not response_complete:
+            deadline_stats["client_disconnected"] += 1
+            return
+
+        deadline_stats["deadline_exceeded"] += 1
+        if not response_started:
+            response = deadline_exceeded_response(
+                f"Request did not finish within its {budget:g}s deadline."
+            )
+            await response(scope, receive, send)
@@ -3,6 +3,8 @@ from fastapi import APIRouter
 from app.api.routes.cleanings import router as cleanings_router
 from app.api.routes.users import router as users_router
 from app.api.routes.profiles import router as profiles_router
+from app.api.routes.metrics import router as metrics_router
+from app.api.routes.health import router as health_router
 
 
 router = APIRouter()
@@ -11,3 +13,5 @@ router = APIRouter()
 router.include_router(cleanings_router, prefix="/cleanings", tags=["Cleanings"])
 router.include_router(users_router, prefix="/users", tags=["Users"])
 router.include_router(profiles_router, prefix="/profiles", tags=["Profiles"])
+router.include_router(metrics_router, prefix="/metrics", tags=["Metrics"])
+router.include_router(health_router, prefix="/health", tags=["Health"])
@@ -1,13 +1,35 @@
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Body, Depends
 from fastapi.exceptions import HTTPException
-from starlette.status import HTTP_201_CREATED, HTTP_404_NOT_FOUND
+from starlette.responses import Response, StreamingResponse
+from starlette.status import (
+    HTTP_201_CREATED,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_404_NOT_FOUND,
+    HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+)
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Path
-from app.models.cleaning import CleaningCreate, CleaningUpdate, CleaningPublic
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Path, Query
+from pydantic import conint
+from app.core.etag import etag_matches
+from app.core.config import (
+    CLEANINGS_BULK_DELETE_MAX_SIZE,
+    CLEANINGS_BULK_MAX_SIZE,
+    CLEANINGS_MAX_PAGE_SIZE,
+    CLEANINGS_PAGE_SIZE,
+)
+from app.models.cleaning import (
+    CleaningCreate,
+    CleaningUpdate,
+    CleaningPage,
+    CleaningPublic,
+    CleaningSort,
+    CleaningType,
+)
 
 from app.api.dependencies.database import get_repository
+from app.db.repositories.base import MAX_ID
 from app.db.repositories.cleanings import CleaningsRepository
 from app.models.cleaning import CleaningCreate, CleaningPublic
 
@@ -28,6 +50,25 @@ async def delete_cleaning_by_id(
     return delete_id
 
 
+# Deletes every cleaning in ids with one statement and returns the ids
+# that actually existed. Ids that match nothing are simply left out of
+# the response, so callers can retry a partially applied batch safely.
+@router.delete("/", response_model=List[int], name="cleanings:bulk-delete-cleanings")
+async def bulk_delete_cleanings(
+    ids: List[conint(ge=1, le=MAX_ID)] = Query(
+        ..., title="The IDs of the cleanings to delete"
+    ),
+    cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
+) -> List[int]:
+    if len(ids) > CLEANINGS_BULK_DELETE_MAX_SIZE:
+        raise HTTPException(
+            status_code=HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Cannot delete more than {CLEANINGS_BULK_DELETE_MAX_SIZE} cleanings at once.",
+        )
+
+    return await cleanings_repo.bulk_delete_cleanings(ids=ids)
+
+
 # Path(..., ge=1 ==. With ge=1, we're telling FastAPI that the
 # cleaning id must be an integer greater than or equal to 1.
 # If it's not, FastAPI will return an HTTP_422_UNPROCESSABLE_ENTITY
@@ -78,26 +119,103 @@ async def create_new_cleaning(
     return created_cleaning
 
 
+# Creates every cleaning in the list in one transaction and returns
+# their ids in the order they were sent. Rows are written a chunk at a
+# time with one INSERT per chunk instead of one round trip per cleaning.
+@router.post(
+    "/bulk/",
+    response_model=List[int],
+    name="cleanings:bulk-create-cleanings",
+    status_code=HTTP_201_CREATED,
+)
+async def bulk_create_cleanings(
+    new_cleanings: List[CleaningCreate] = Body(..., embed=True),
+    cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
+) -> List[int]:
+    if len(new_cleanings) > CLEANINGS_BULK_MAX_SIZE:
+        raise HTTPException(
+            status_code=HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Cannot create more than {CLEANINGS_BULK_MAX_SIZE} cleanings at once.",
+        )
+
+    return await cleanings_repo.bulk_create_cleanings(new_cleanings=new_cleanings)
+
+
+# Full text search over cleaning names and descriptions, best matches
+# first. q accepts web search syntax: "quoted phrases", OR and -exclude.
+@router.get("/search/", response_model=CleaningPage, name="cleanings:search-cleanings")
+async def search_cleanings(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(CLEANINGS_PAGE_SIZE, ge=1, le=CLEANINGS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, title="The next_cursor of the previous page"),
+    cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
+) -> CleaningPage:
+    return await cleanings_repo.search_cleanings(q=q, limit=limit, cursor=cursor)
+
+
+# Newline delimited JSON: one cleaning per line, written out as rows
+# come off the database cursor. Memory use stays the same whatever the
+# size of the table. Declared before "/{id}/" so "export" is not taken
+# for a cleaning id.
+@router.get(
+    "/export/",
+    response_class=StreamingResponse,
+    name="cleanings:export-cleanings",
+)
+async def export_cleanings(
+    cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
+) -> StreamingResponse:
+    async def ndjson_lines():
+        async for cleaning in cleanings_repo.iterate_all_cleanings():
+            yield cleaning.json() + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
 @router.get(
     "/{id}/", response_model=CleaningPublic, name="cleanings:get-cleaning-by-id"
 )
 async def get_cleaning_by_id(
     id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
 ) -> CleaningPublic:
-    cleaning = await cleanings_repo.get_cleaning_by_id(id=id)
+    cleaning, etag = await cleanings_repo.get_cleaning_and_etag_by_id(id=id)
 
     if not cleaning:
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND, detail="No cleaning found with that id."
         )
+
+    # the client already has this version, skip building the body
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
     return cleaning
 
 
-@router.get(
-    "/", response_model=List[CleaningPublic], name="cleanings:get-all-cleanings"
-)
+# The list is paginated by cursor. Each page carries a next_cursor that
+# the client sends back untouched to get the following page, and limit
+# is capped at CLEANINGS_MAX_PAGE_SIZE so no single call can pull the
+# whole table. cleaning_type and the price range narrow the list, and
+# sort picks one of the indexed orderings in CleaningSort.
+@router.get("/", response_model=CleaningPage, name="cleanings:get-all-cleanings")
 async def get_all_cleanings(
+    limit: int = Query(CLEANINGS_PAGE_SIZE, ge=1, le=CLEANINGS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, title="The next_cursor of the previous page"),
+    cleaning_type: Optional[CleaningType] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: CleaningSort = Query(CleaningSort.id),
     cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
-) -> List[CleaningPublic]:
-    return await cleanings_repo.get_all_cleanings()
+) -> CleaningPage:
+    return await cleanings_repo.get_all_cleanings(
+        limit=limit,
+        cursor=cursor,
+        cleaning_type=cleaning_type,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+    )
@@ -0,0 +1,21 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, status
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+router = APIRouter()
+
+
+# For the load balancer: 503 until startup has connected to the database
+# and warmed up, and again once shutdown has begun, so traffic only goes
+# to workers that are ready for it.
+@router.get("/ready/", response_model=Dict[str, Any], name="health:get-readiness")
+async def get_readiness(request: Request) -> JSONResponse:
+    ready = getattr(request.app.state, "ready", False)
+    return JSONResponse(
+        {"ready": ready},
+        status_code=status.HTTP_200_OK
+        if ready
+        else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
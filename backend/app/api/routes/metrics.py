@@ -0,0 +1,21 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+
+from app.api.dependencies.auth import require_metrics_token
+from app.core.metrics import collect_metrics
+
+router = APIRouter()
+
+
+# Internal numbers for tuning a running worker, such as cache hit rates.
+# Every worker process reports only its own counters. Callers need the
+# METRICS_TOKEN, since the numbers say a lot about how the service is run.
+@router.get(
+    "/",
+    response_model=Dict[str, Any],
+    name="metrics:get-metrics",
+    dependencies=[Depends(require_metrics_token)],
+)
+async def get_metrics() -> Dict[str, Any]:
+    return collect_metrics()
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Path, Body, HTTPException, status, Depends
+from typing import List, Optional
+
+from fastapi import APIRouter, Path, Body, Header, HTTPException, Query, status, Depends
+from starlette.responses import Response
+
+from app.core.config import PROFILES_BATCH_MAX_SIZE
+from app.core.etag import etag_matches, make_etag
 from app.api.dependencies.auth import get_current_active_user
 from app.api.dependencies.database import get_repository
 
 from app.models.user import UserCreate, UserUpdate, UserInDB, UserPublic
-from app.models.profile import ProfileUpdate, ProfilePublic
+from app.models.profile import ProfileBatch, ProfileUpdate, ProfilePublic
 
 from app.db.repositories.profiles import ProfilesRepository
 
@@ -22,6 +28,62 @@ async def update_own_profile(
     return updated_profile
 
 
+def split_batch_param(value: str) -> List[str]:
+    """
+    Split a comma separated query param, dropping blanks and repeats
+    while keeping the order the values were given in
+    """
+    values = [item.strip() for item in value.split(",")]
+    return list(dict.fromkeys(item for item in values if item))
+
+
+# Resolve many profiles in one round trip, e.g. ?usernames=a,b,c or
+# ?user_ids=1,2,3. Profiles come back in the order they were asked for
+# and anything that matched no profile is listed as missing.
+@router.get("/", response_model=ProfileBatch, name="profiles:get-profiles-batch")
+async def get_profiles_batch(
+    usernames: Optional[str] = Query(None, title="Comma separated usernames"),
+    user_ids: Optional[str] = Query(None, title="Comma separated user ids"),
+    current_user: UserInDB = Depends(get_current_active_user),
+    profiles_repo: ProfilesRepository = Depends(get_repository(ProfilesRepository)),
+) -> ProfileBatch:
+    if (usernames is None) == (user_ids is None):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Provide either usernames or user_ids.",
+        )
+
+    keys = split_batch_param(usernames if usernames is not None else user_ids)
+    if len(keys) > PROFILES_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Cannot look up more than {PROFILES_BATCH_MAX_SIZE} profiles at once.",
+        )
+
+    if usernames is not None:
+        profiles = await profiles_repo.get_profiles_by_usernames(usernames=keys)
+        found = {profile.username for profile in profiles}
+        return ProfileBatch(
+            profiles=profiles,
+            missing_usernames=[username for username in keys if username not in found],
+        )
+
+    try:
+        ids = list(dict.fromkeys(int(user_id) for user_id in keys))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="user_ids must be comma separated integers.",
+        )
+
+    profiles = await profiles_repo.get_profiles_by_user_ids(user_ids=ids)
+    found = {profile.user_id for profile in profiles}
+    return ProfileBatch(
+        profiles=profiles,
+        missing_user_ids=[user_id for user_id in ids if user_id not in found],
+    )
+
+
 @router.get(
     "/{username}/",
     response_model=ProfilePublic,
@@ -30,6 +92,8 @@ async def update_own_profile(
 async def get_profile_by_username(
     *,
     username: str = Path(..., min_length=3, regex="^[a-zA-Z0-9_-]+$"),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: UserInDB = Depends(get_current_active_user),
     profiles_repo: ProfilesRepository = Depends(get_repository(ProfilesRepository)),
 ) -> ProfilePublic:
@@ -41,4 +105,15 @@ async def get_profile_by_username(
             detail="No profile found with that username",
         )
 
-    return profile
\ No newline at end of file
+    # updated_at is bumped by the update_profiles_modtime trigger; the
+    # username and email come from the users row so they go in as well
+    etag = make_etag(
+        "profile", profile.id, profile.updated_at, profile.username, profile.email
+    )
+    if etag_matches(etag, if_none_match):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    response.headers["ETag"] = etag
+    return profile
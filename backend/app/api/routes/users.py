@@ -14,7 +14,7 @@ from app.models.token import AccessToken
 from app.services import auth_service
 
 
-from app.api.dependencies.auth import get_current_active_user
+from app.api.dependencies.auth import get_current_active_user, throttle_login_attempts
 from app.models.user import UserCreate, UserUpdate, UserInDB, UserPublic
 
 from app.db.repositories.users import UsersRepository
@@ -30,7 +30,10 @@ async def get_currently_authenticated_user(
 
 
 @router.post(
-    "/login/token/", response_model=AccessToken, name="users:login-email-and-password"
+    "/login/token/",
+    response_model=AccessToken,
+    name="users:login-email-and-password",
+    dependencies=[Depends(throttle_login_attempts)],
 )
 async def user_login_with_email_and_password(
     user_repo: UsersRepository = Depends(get_repository(UsersRepository)),
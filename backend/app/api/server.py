@@ -1,14 +1,27 @@
+from asyncpg.exceptions import QueryCanceledError
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core import config, tasks
 
+from app.api.middleware import (
+    DeadlineMiddleware,
+    UnitOfWorkMiddleware,
+    query_canceled_handler,
+)
+
 from app.api.routes import router as api_router
 
 
 def get_application():
     app = FastAPI(title=config.PROJECT_NAME, version=config.VERSION)
 
+    app.add_middleware(UnitOfWorkMiddleware)
+    app.add_middleware(
+        DeadlineMiddleware,
+        default_seconds=config.REQUEST_DEADLINE_SECONDS,
+        overrides=config.REQUEST_DEADLINE_OVERRIDES,
+    )
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -17,6 +30,8 @@ def get_application():
         allow_headers=["*"],
     )
 
+    app.add_exception_handler(QueryCanceledError, query_canceled_handler)
+
     app.add_event_handler("startup", tasks.create_start_app_handler(app))
     app.add_event_handler("shutdown", tasks.create_stop_app_handler(app))
 
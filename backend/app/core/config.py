@@ -1,13 +1,6 @@
-import pytest
-
-from databases import Database
-
 from databases import DatabaseURL
 from starlette.config import Config
-from starlette.datastructures import Secret
-
-from app.models.cleaning import CleaningCreate, CleaningInDB
-from app.db.repositories.cleanings import CleaningsRepository
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 config = Config(".env")
 
@@ -23,6 +16,10 @@ JWT_ALGORITHM = config("JWT_ALGORITHM", cast=str, default="HS256")
 JWT_AUDIENCE = config("JWT_AUDIENCE", cast=str, default="phresh:auth")
 JWT_TOKEN_PREFIX = config("JWT_TOKEN_PREFIX", cast=str, default="Bearer")
 
+# Shared secret that scrapers send in the X-Metrics-Token header to read
+# /api/metrics/. Left empty, the metrics endpoint turns every request away.
+METRICS_TOKEN = config("METRICS_TOKEN", cast=Secret, default="")
+
 POSTGRES_USER = config("POSTGRES_USER", cast=str)
 POSTGRES_PASSWORD = config("POSTGRES_PASSWORD", cast=Secret)
 POSTGRES_SERVER = config("POSTGRES_SERVER", cast=str, default="db")
@@ -34,3 +31,110 @@ DATABASE_URL = config(
     cast=DatabaseURL,
     default=f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}",
 )
+
+# Connection pool per worker process. Keep DB_POOL_MAX_SIZE times the
+# number of workers under postgres max_connections. Requests that wait
+# longer than the acquire timeout for a connection get a 503, and idle
+# connections are closed after DB_POOL_MAX_IDLE_SECONDS (0 keeps them).
+DB_POOL_MIN_SIZE = config("DB_POOL_MIN_SIZE", cast=int, default=2)
+DB_POOL_MAX_SIZE = config("DB_POOL_MAX_SIZE", cast=int, default=10)
+DB_POOL_ACQUIRE_TIMEOUT_SECONDS = config(
+    "DB_POOL_ACQUIRE_TIMEOUT_SECONDS", cast=float, default=10
+)
+DB_POOL_MAX_IDLE_SECONDS = config("DB_POOL_MAX_IDLE_SECONDS", cast=float, default=300)
+
+# Optional read replicas, comma separated urls. Read only repository
+# methods are spread over them; writes always go to DATABASE_URL. After
+# a write the same client keeps reading from the primary for
+# READ_YOUR_WRITES_SECONDS so it sees its own changes despite replica lag.
+DATABASE_REPLICA_URLS = config(
+    "DATABASE_REPLICA_URLS", cast=CommaSeparatedStrings, default=""
+)
+READ_YOUR_WRITES_SECONDS = config("READ_YOUR_WRITES_SECONDS", cast=float, default=5)
+
+# Queries slower than SLOW_QUERY_MS are logged with their parameters
+# redacted. A sampled share of slow SELECTs is run again under EXPLAIN
+# ANALYZE in the background and the plan logged too, 0 turns that off.
+SLOW_QUERY_MS = config("SLOW_QUERY_MS", cast=float, default=200)
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = config(
+    "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", cast=float, default=0
+)
+
+# Every request has REQUEST_DEADLINE_SECONDS to finish, or the budget
+# given to its route name in REQUEST_DEADLINE_OVERRIDES as comma
+# separated "route-name=seconds" pairs. Its database statements are
+# limited to what is left of the budget, and a request that runs out
+# gets a 504. Requests are cancelled when the client hangs up.
+REQUEST_DEADLINE_SECONDS = config("REQUEST_DEADLINE_SECONDS", cast=float, default=10)
+REQUEST_DEADLINE_OVERRIDES = config(
+    "REQUEST_DEADLINE_OVERRIDES",
+    cast=CommaSeparatedStrings,
+    default="cleanings:export-cleanings=300",
+)
+
+# keyset pagination for the cleanings list
+CLEANINGS_PAGE_SIZE = config("CLEANINGS_PAGE_SIZE", cast=int, default=50)
+CLEANINGS_MAX_PAGE_SIZE = config("CLEANINGS_MAX_PAGE_SIZE", cast=int, default=200)
+
+# bulk cleaning inserts: rows per INSERT statement and items per request
+CLEANINGS_BULK_CHUNK_SIZE = config("CLEANINGS_BULK_CHUNK_SIZE", cast=int, default=1000)
+CLEANINGS_BULK_MAX_SIZE = config("CLEANINGS_BULK_MAX_SIZE", cast=int, default=10000)
+
+# bulk deletes take their ids in the query string, so keep the URL well
+# under the usual request line limits (~8KB)
+CLEANINGS_BULK_DELETE_MAX_SIZE = config(
+    "CLEANINGS_BULK_DELETE_MAX_SIZE", cast=int, default=500
+)
+
+# read-through cache in front of CleaningsRepository.get_cleaning_by_id,
+# a size of 0 turns it off. With read replicas only reads that went to
+# the primary fill it.
+CLEANINGS_CACHE_SIZE = config("CLEANINGS_CACHE_SIZE", cast=int, default=1024)
+CLEANINGS_CACHE_TTL_SECONDS = config(
+    "CLEANINGS_CACHE_TTL_SECONDS", cast=float, default=60
+)
+
+# bcrypt runs in a thread pool so it never blocks the event loop. Calls
+# beyond PASSWORD_HASH_WORKERS wait in a queue; once PASSWORD_HASH_MAX_QUEUE
+# are waiting, new logins and sign ups get an immediate 503.
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", cast=int, default=4)
+PASSWORD_HASH_MAX_QUEUE = config("PASSWORD_HASH_MAX_QUEUE", cast=int, default=32)
+
+# Users resolved from access tokens are cached for a few seconds so
+# protected routes skip the user and profile queries. TTL is the longest
+# a change made on another worker (e.g. deactivating a user) can go
+# unnoticed here. A size of 0 turns the cache off.
+AUTH_USER_CACHE_SIZE = config("AUTH_USER_CACHE_SIZE", cast=int, default=1024)
+AUTH_USER_CACHE_TTL_SECONDS = config(
+    "AUTH_USER_CACHE_TTL_SECONDS", cast=float, default=10
+)
+
+# verified access tokens, each kept until it expires; 0 turns it off
+ACCESS_TOKEN_CACHE_SIZE = config("ACCESS_TOKEN_CACHE_SIZE", cast=int, default=4096)
+
+# most usernames or user ids accepted by a single batch profile lookup
+PROFILES_BATCH_MAX_SIZE = config("PROFILES_BATCH_MAX_SIZE", cast=int, default=100)
+
+# Login attempts are throttled with token buckets per client ip and per
+# email before any password hashing or database work happens.
+LOGIN_ATTEMPTS_PER_IP_BURST = config(
+    "LOGIN_ATTEMPTS_PER_IP_BURST", cast=int, default=30
+)
+LOGIN_ATTEMPTS_PER_IP_PER_MINUTE = config(
+    "LOGIN_ATTEMPTS_PER_IP_PER_MINUTE", cast=float, default=30
+)
+LOGIN_ATTEMPTS_PER_EMAIL_BURST = config(
+    "LOGIN_ATTEMPTS_PER_EMAIL_BURST", cast=int, default=10
+)
+LOGIN_ATTEMPTS_PER_EMAIL_PER_MINUTE = config(
+    "LOGIN_ATTEMPTS_PER_EMAIL_PER_MINUTE", cast=float, default=5
+)
+
+# New passwords are hashed with the first scheme at PASSWORD_HASH_ROUNDS.
+# Hashes using a later scheme or another cost still verify and are
+# rehashed on the next successful login. Pick the cost with
+# python -m app.services.calibrate_password_hashing
+PASSWORD_HASH_SCHEMES = config(
+    "PASSWORD_HASH_SCHEMES", cast=CommaSeparatedStrings, default="bcrypt"
+)
+PASSWORD_HASH_ROUNDS = config("PASSWORD_HASH_ROUNDS", cast=int, default=12)
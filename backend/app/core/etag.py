@@ -0,0 +1,35 @@
+import hashlib
+from typing import Any, Optional
+
+from app.core.config import VERSION
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Strong ETag from whatever identifies one version of a resource,
+    usually its id and updated_at. The API version is mixed in so a
+    release that changes a response shape also changes its ETags.
+    """
+    version = ":".join(str(part) for part in (VERSION, *parts))
+    return '"' + hashlib.blake2b(version.encode(), digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """
+    True when an If-None-Match header lists etag, i.e. the client's copy
+    is still current and a 304 can be sent instead of the body.
+    If-None-Match uses weak comparison, so a W/ prefix is ignored.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+
+    return False
@@ -0,0 +1,44 @@
+from typing import Any, Callable, Dict, Sequence
+
+# Anything worth watching in a running worker (caches, pools, timings)
+# registers a function here that returns its current numbers. They are
+# all served together by the metrics:get-metrics route.
+_metrics_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    _metrics_providers[name] = provider
+
+
+def collect_metrics() -> Dict[str, Dict[str, Any]]:
+    return {name: provider() for name, provider in _metrics_providers.items()}
+
+
+class Histogram:
+    """
+    Counts observations into fixed buckets. Like prometheus, each bucket
+    counts every observation less than or equal to its upper bound, so
+    the last one ("+Inf") is the total count.
+    """
+
+    def __init__(self, *, buckets: Sequence[float]) -> None:
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.counts[-1] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        labels = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
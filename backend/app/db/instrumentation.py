@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import logging
+import random
+import sys
+import time
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional
+
+from databases import Database
+
+from app.core.config import SLOW_QUERY_EXPLAIN_SAMPLE_RATE, SLOW_QUERY_MS
+from app.core.metrics import Histogram, register_metrics
+
+logger = logging.getLogger(__name__)
+
+QUERY_LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# a sampled EXPLAIN ANALYZE runs the slow query once more, cap how long
+EXPLAIN_TIMEOUT_MS = 30000
+
+# query name -> latency histogram in milliseconds
+query_latency: Dict[str, Histogram] = {}
+register_metrics(
+    "queries", lambda: {name: h.stats() for name, h in sorted(query_latency.items())}
+)
+
+
+def redact_values(values: Optional[Mapping[str, Any]]) -> Dict[str, str]:
+    """
+    Keep the parameter names and types for the log but never the values,
+    they can hold emails, password hashes and the like.
+    """
+    return {key: type(value).__name__ for key, value in (values or {}).items()}
+
+
+# only hand queries on to the Database, the name comes from their caller
+PASS_THROUGH_MODULES = {"app.db.unit_of_work"}
+
+# repository query text -> "<module>.<constant>", filled on first use
+_constant_names: Optional[Dict[str, str]] = None
+
+
+def constant_name(query: Any) -> Optional[str]:
+    global _constant_names
+    if _constant_names is None:
+        # imported here, the repositories import half of app.db
+        from app.db.warm_up import repository_queries
+
+        _constant_names = {sql: name for name, sql in repository_queries().items()}
+
+    return _constant_names.get(query) if isinstance(query, str) else None
+
+
+def query_name(frame: Any, query: Any) -> str:
+    """
+    Name a query after the repository constant holding it, e.g.
+    users.GET_USER_BY_EMAIL_QUERY, so one method running different
+    queries gets a histogram for each. Templated and ad hoc queries
+    produce different SQL per call and are named after the function that
+    ran them instead, e.g. cleanings.get_all_cleanings for
+    CleaningsRepository.get_all_cleanings.
+    """
+    name = constant_name(query)
+    if name is not None:
+        return name
+
+    while (
+        frame.f_back is not None
+        and frame.f_globals.get("__name__") in PASS_THROUGH_MODULES
+    ):
+        frame = frame.f_back
+
+    module = frame.f_globals.get("__name__", "").rsplit(".", 1)[-1]
+    return f"{module}.{frame.f_code.co_name}"
+
+
+class InstrumentedDatabase(Database):
+    """
+    A Database that times every fetch_one, fetch_all, fetch_val, execute
+    and iterate (waiting for a connection included) into a histogram per
+    query name, served as "queries" by the metrics route.
+    """
+
+    # at most one sampled EXPLAIN ANALYZE runs at a time
+    _explain_task: Optional[asyncio.Future] = None
+
+    async def fetch_all(self, query: Any, values: dict = None) -> List[Mapping]:
+        return await self._timed(
+            query_name(sys._getframe(1), query), super().fetch_all, query, values
+        )
+
+    async def fetch_one(self, query: Any, values: dict = None) -> Optional[Mapping]:
+        return await self._timed(
+            query_name(sys._getframe(1), query), super().fetch_one, query, values
+        )
+
+    async def fetch_val(self, query: Any, values: dict = None, column: Any = 0) -> Any:
+        return await self._timed(
+            query_name(sys._getframe(1), query),
+            super().fetch_val,
+            query,
+            values,
+            column,
+        )
+
+    async def execute(self, query: Any, values: dict = None) -> Any:
+        return await self._timed(
+            query_name(sys._getframe(1), query), super().execute, query, values
+        )
+
+    async def iterate(
+        self, query: Any, values: dict = None
+    ) -> AsyncGenerator[Mapping, None]:
+        """
+        Timed up to the first row, after that the pace is set by whoever
+        consumes the stream. Never explained, since EXPLAIN ANALYZE would
+        read the whole result again.
+        """
+        name = query_name(sys._getframe(1), query)
+        started = time.perf_counter()
+        timed = False
+        try:
+            async for record in super().iterate(query, values):
+                if not timed:
+                    timed = True
+                    self._record(name, started, query, values, explain=False)
+                yield record
+        finally:
+            if not timed:
+                self._observe(name, started)
+
+    async def _timed(
+        self, name: str, run: Any, query: Any, values: Any, *args: Any
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await run(query, values, *args)
+        except BaseException:
+            # Failed and cancelled queries, such as those cut short by a
+            # request deadline, only count towards the latency. Explaining
+            # them would fail in an aborted transaction or run an expensive
+            # query again for a request that is already out of time.
+            self._observe(name, started)
+            raise
+
+        self._record(name, started, query, values)
+        return result
+
+    def _observe(self, name: str, started: float) -> float:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        histogram = query_latency.get(name)
+        if histogram is None:
+            histogram = query_latency[name] = Histogram(
+                buckets=QUERY_LATENCY_BUCKETS_MS
+            )
+        histogram.observe(elapsed_ms)
+        return elapsed_ms
+
+    def _record(
+        self,
+        name: str,
+        started: float,
+        query: Any,
+        values: Any,
+        *,
+        explain: bool = True,
+    ) -> None:
+        elapsed_ms = self._observe(name, started)
+        if elapsed_ms < SLOW_QUERY_MS:
+            return
+
+        sql = " ".join(str(query).split())
+        logger.warning(
+            "Slow query %s took %.1fms: %s params=%s",
+            name,
+            elapsed_ms,
+            sql,
+            redact_values(values),
+        )
+
+        # EXPLAIN ANALYZE runs the statement again, so only plain SELECTs
+        if not explain or not sql.upper().startswith("SELECT"):
+            return
+        if random.random() >= SLOW_QUERY_EXPLAIN_SAMPLE_RATE:
+            return
+        if self._explain_task is not None and not self._explain_task.done():
+            return
+
+        # Off the request path, and in an empty context so the EXPLAIN
+        # gets a pool connection of its own rather than the request's,
+        # which may be busy or inside a transaction.
+        self._explain_task = contextvars.Context().run(
+            asyncio.ensure_future, self._explain_slow_query(name, query, values)
+        )
+
+    async def _explain_slow_query(self, name: str, query: Any, values: Any) -> None:
+        try:
+            async with self.connection() as connection:
+                async with connection.transaction():
+                    await connection.execute(
+                        f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}"
+                    )
+                    plan = await connection.fetch_all(
+                        f"EXPLAIN ANALYZE {query}", values
+                    )
+        except Exception as e:
+            logger.warning("Could not explain slow query %s: %s", name, e)
+            return
+
+        logger.warning(
+            "Plan for slow query %s:\n%s",
+            name,
+            "\n".join(row["QUERY PLAN"] for row in plan),
+        )
@@ -17,8 +17,9 @@ from app.core.config import DATABASE_URL, POSTGRES_DB  # noqa
 # Alembic Config object, which provides access to values within the .ini file
 config = alembic.context.config
 
-# Interpret the config file for logging
-fileConfig(config.config_file_name)
+# Interpret the config file for logging. Migrations also run inside the
+# test process, so leave the loggers the app already created enabled.
+fileConfig(config.config_file_name, disable_existing_loggers=False)
 logger = logging.getLogger("alembic.env")
 
 
@@ -0,0 +1,39 @@
+"""add_cleanings_list_indexes
+
+Revision ID: 5b1c2e7f9a3d
+Revises: 48976538dfd0
+Create Date: 2026-10-18 09:12:44.210934
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = "5b1c2e7f9a3d"
+down_revision = "48976538dfd0"
+branch_labels = None
+depends_on = None
+
+
+# The cleanings list filters on cleaning_type and a price range and
+# pages through results ordered by (sort column, id), see
+# GET_ALL_CLEANINGS_QUERY. Each ordering gets an index whose trailing
+# columns match the ORDER BY, so postgres can seek to the cursor and
+# read one page worth of rows instead of sorting the whole table.
+# Descending sorts walk the same indexes backwards.
+CLEANINGS_LIST_INDEXES = {
+    "ix_cleanings_price_id": ["price", "id"],
+    "ix_cleanings_created_at_id": ["created_at", "id"],
+    "ix_cleanings_cleaning_type_id": ["cleaning_type", "id"],
+    "ix_cleanings_cleaning_type_price_id": ["cleaning_type", "price", "id"],
+    "ix_cleanings_cleaning_type_created_at_id": ["cleaning_type", "created_at", "id"],
+}
+
+
+def upgrade() -> None:
+    for index_name, columns in CLEANINGS_LIST_INDEXES.items():
+        op.create_index(index_name, "cleanings", columns)
+
+
+def downgrade() -> None:
+    for index_name in CLEANINGS_LIST_INDEXES:
+        op.drop_index(index_name, table_name="cleanings")
@@ -0,0 +1,49 @@
+"""add_cleanings_search_vector
+
+Revision ID: 8e4f0a6c2d71
+Revises: 5b1c2e7f9a3d
+Create Date: 2026-10-18 10:03:51.448217
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = "8e4f0a6c2d71"
+down_revision = "5b1c2e7f9a3d"
+branch_labels = None
+depends_on = None
+
+
+def create_cleanings_search_vector() -> None:
+    # A stored generated column keeps the tsvector in step with name
+    # and description on every insert and update, no trigger needed.
+    # Matches in the name (weight A) rank above matches in the
+    # description (weight B).
+    op.execute(
+        """
+        ALTER TABLE cleanings
+        ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED;
+        """
+    )
+
+    # the GIN index is what lets `search_vector @@ query` skip
+    # every cleaning that cannot match
+    op.create_index(
+        "ix_cleanings_search_vector",
+        "cleanings",
+        ["search_vector"],
+        postgresql_using="gin",
+    )
+
+
+def upgrade() -> None:
+    create_cleanings_search_vector()
+
+
+def downgrade() -> None:
+    op.drop_index("ix_cleanings_search_vector", table_name="cleanings")
+    op.drop_column("cleanings", "search_vector")
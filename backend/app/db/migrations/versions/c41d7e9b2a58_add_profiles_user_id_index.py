@@ -0,0 +1,48 @@
+"""add_profiles_user_id_index
+
+Revision ID: c41d7e9b2a58
+Revises: 8e4f0a6c2d71
+Create Date: 2026-10-18 14:27:09.731502
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = "c41d7e9b2a58"
+down_revision = "8e4f0a6c2d71"
+branch_labels = None
+depends_on = None
+
+
+def check_for_duplicate_profiles() -> None:
+    # Nothing stopped a user from ending up with more than one profile
+    # row. Which one to keep is a data decision, so refuse to build the
+    # unique index below until they've been merged or removed by hand.
+    duplicates = op.get_bind().execute(
+        """
+        SELECT user_id
+        FROM profiles
+        GROUP BY user_id
+        HAVING COUNT(*) > 1
+        ORDER BY user_id;
+        """
+    )
+    user_ids = [row[0] for row in duplicates]
+    if user_ids:
+        raise RuntimeError(
+            "Cannot add a unique index on profiles.user_id, these users have "
+            f"more than one profile: {', '.join(map(str, user_ids))}"
+        )
+
+
+def upgrade() -> None:
+    check_for_duplicate_profiles()
+
+    # Every authenticated request loads the profile of the user by
+    # user_id, and deleting a user cascades to profiles through the same
+    # column. Unique as well, since each user has exactly one profile.
+    op.create_index("ix_profiles_user_id", "profiles", ["user_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_profiles_user_id", table_name="profiles")
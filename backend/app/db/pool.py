@@ -0,0 +1,73 @@
+import asyncio
+import time
+from typing import Any, Dict
+
+from databases import Database
+from fastapi import HTTPException, status
+
+from app.core.metrics import Histogram
+
+# milliseconds spent waiting for a connection
+ACQUIRE_LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class InstrumentedPool:
+    """
+    Sits in front of the asyncpg pool of a connected Database. Every
+    connection the databases package checks out goes through acquire
+    here, which enforces the acquire timeout and times the wait. All
+    other attributes are passed through to the asyncpg pool.
+    """
+
+    def __init__(self, pool: Any, *, acquire_timeout: float) -> None:
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.waiting = 0
+        self.timeouts = 0
+        self.acquire_latency = Histogram(buckets=ACQUIRE_LATENCY_BUCKETS_MS)
+
+    async def acquire(self) -> Any:
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Timed out waiting for a database connection.",
+                headers={"Retry-After": "1"},
+            )
+        finally:
+            self.waiting -= 1
+
+        self.acquire_latency.observe((time.perf_counter() - started) * 1000)
+        return connection
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    def stats(self) -> Dict[str, Any]:
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "size": size,
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+            "in_use": size - idle,
+            "idle": idle,
+            "waiters": self.waiting,
+            "acquire_timeouts": self.timeouts,
+            "acquire_ms": self.acquire_latency.stats(),
+        }
+
+
+def instrument_pool(database: Database, *, acquire_timeout: float) -> InstrumentedPool:
+    """
+    Swap the asyncpg pool inside a connected Database for an
+    InstrumentedPool. databases has no hook for this, so it reaches into
+    the postgres backend.
+    """
+    pool = InstrumentedPool(database._backend._pool, acquire_timeout=acquire_timeout)
+    database._backend._pool = pool
+    return pool
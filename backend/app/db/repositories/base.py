@@ -1,6 +1,64 @@
+import base64
+import json
+from typing import Any, Dict, Optional
+
 from databases import Database
+from fastapi import HTTPException, status
+
+# ids are serial (int4) columns, anything outside this range can't match
+# a row and would make postgres raise instead of returning an empty page
+MAX_ID = 2 ** 31 - 1
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """
+    Pack the keyset values of the last row on a page into an opaque,
+    url safe string that clients hand back to fetch the next page.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        values = None
+
+    if not isinstance(values, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor.",
+        )
+
+    return values
+
+
+def is_valid_id(value: Any) -> bool:
+    return (
+        isinstance(value, int) and not isinstance(value, bool) and 0 < value <= MAX_ID
+    )
 
 
 class BaseRepository:
-    def __init__(self, db: Database) -> None:
+    """
+    self.db is the primary and takes every write. Read only methods go
+    through self.reader_db, a replica when one is configured and the
+    primary otherwise.
+
+    Process wide caches are only read when use_cache is set, which it
+    isn't for clients that wrote recently, and only filled from the
+    primary: a row from a lagging replica would otherwise be served to
+    everyone for the whole TTL.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        reader_db: Optional[Database] = None,
+        *,
+        use_cache: bool = True,
+    ) -> None:
         self.db = db
+        self.reader_db = reader_db or db
+        self.reads_cache = use_cache
+        self.fills_cache = use_cache and self.reader_db is self.db
@@ -1,11 +1,30 @@
-from typing import List
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, AsyncIterator, List, Optional, Tuple
 
+from asyncpg.exceptions import DataError, IntegrityConstraintViolationError
 from fastapi.exceptions import HTTPException
 from starlette.status import HTTP_400_BAD_REQUEST
-from app.db.repositories.base import BaseRepository
+from app.core.cache import LRUCache
+from app.core.config import (
+    CLEANINGS_BULK_CHUNK_SIZE,
+    CLEANINGS_CACHE_SIZE,
+    CLEANINGS_CACHE_TTL_SECONDS,
+)
+from app.core.etag import make_etag
+from app.core.metrics import register_metrics
+from app.db.repositories.base import (
+    BaseRepository,
+    decode_cursor,
+    encode_cursor,
+    is_valid_id,
+)
+from app.db.unit_of_work import call_on_commit
 from app.models.cleaning import (
     CleaningCreate,
-    CleaningPublic,
+    CleaningPage,
+    CleaningSort,
+    CleaningType,
     CleaningUpdate,
     CleaningInDB,
 )
@@ -17,15 +36,94 @@ CREATE_CLEANING_QUERY = """
     RETURNING id, name, description, price, cleaning_type;
 """
 
+# One INSERT for a whole chunk of cleanings. Each column arrives as a
+# single array parameter and unnest() zips them back into rows, so the
+# statement text is the same no matter how many rows it carries.
+# WITH ORDINALITY keeps the returned ids in the order they were sent.
+BULK_CREATE_CLEANINGS_QUERY = """
+    INSERT INTO cleanings (name, description, price, cleaning_type)
+    SELECT name, description, price, cleaning_type
+    FROM unnest(
+        CAST(:names AS text[]),
+        CAST(:descriptions AS text[]),
+        CAST(:prices AS numeric[]),
+        CAST(:cleaning_types AS text[])
+    ) WITH ORDINALITY AS c (name, description, price, cleaning_type, position)
+    ORDER BY position
+    RETURNING id;
+"""
+
 GET_CLEANING_BY_ID_QUERY = """
-    SELECT id, name, description, price, cleaning_type
+    SELECT id, name, description, price, cleaning_type, updated_at
     FROM cleanings
     WHERE id = :id;
 """
 
+# Keyset pagination: rather than OFFSET, which makes postgres read and
+# throw away every skipped row, we seek straight past the last row of
+# the previous page using an index on (sort column, id). Page cost stays
+# flat however deep into the table the client is.
+#
+# The placeholders are only ever filled from CLEANING_SORT_COLUMNS and
+# fixed condition strings in get_all_cleanings; every client supplied
+# value is a bind parameter.
 GET_ALL_CLEANINGS_QUERY = """
-    SELECT id, name, description, price, cleaning_type  
-    FROM cleanings;  
+    SELECT id, name, description, price, cleaning_type, {sort_column} AS sort_key
+    FROM cleanings
+    WHERE {conditions}
+    ORDER BY {order_by}
+    LIMIT :limit;
+"""
+
+
+def parse_price_key(value: str) -> Decimal:
+    price = Decimal(value)
+    # cursors we hand out carry a numeric(10, 2) price, anything else is
+    # forged and may not even be encodable as a numeric parameter
+    if not price.is_finite() or price != round(price, 2) or abs(price) >= 10 ** 8:
+        raise ValueError
+    return price
+
+
+# largest finite real, ts_rank returns one and the cursor's rank is
+# bound back as one
+FLOAT4_MAX = 3.4028234663852886e38
+
+
+def is_valid_rank(value: Any) -> bool:
+    # also false for NaN, which compares false to everything
+    return isinstance(value, float) and 0 <= value <= FLOAT4_MAX
+
+
+# sort -> (column, direction, parser for the column value in a cursor)
+CLEANING_SORT_COLUMNS = {
+    CleaningSort.id: ("id", "ASC", int),
+    CleaningSort.price: ("price", "ASC", parse_price_key),
+    CleaningSort.price_desc: ("price", "DESC", parse_price_key),
+    CleaningSort.created_at: ("created_at", "ASC", datetime.fromisoformat),
+    CleaningSort.created_at_desc: ("created_at", "DESC", datetime.fromisoformat),
+}
+
+# Full text search over name and description, backed by the GIN index on
+# the generated search_vector column. Results come back best match first
+# and page by keyset on (rank, id) like the plain list does.
+SEARCH_CLEANINGS_QUERY = """
+    SELECT id, name, description, price, cleaning_type, rank
+    FROM (
+        SELECT id, name, description, price, cleaning_type,
+               ts_rank(search_vector, query) AS rank
+        FROM cleanings, websearch_to_tsquery('english', :q) AS query
+        WHERE search_vector @@ query
+    ) AS matches
+    WHERE {after}
+    ORDER BY rank DESC, id DESC
+    LIMIT :limit;
+"""
+
+EXPORT_CLEANINGS_QUERY = """
+    SELECT id, name, description, price, cleaning_type
+    FROM cleanings
+    ORDER BY id;
 """
 
 # https://www.postgresql.org/docs/current/sql-update.html
@@ -36,31 +134,160 @@ GET_ALL_CLEANINGS_QUERY = """
 # (post-update) values of the table's columns are used. The
 # syntax of the RETURNING list is identical to that of the
 # output list of SELECT.
+#
+# Only the columns the client actually sent are written. The SET list is
+# filled in by update_cleaning from the CleaningUpdate fields that were
+# set, so the read-merge-write happens inside postgres in one statement
+# and a concurrent update to other columns is never overwritten. No row
+# coming back means there was no cleaning with that id.
 UPDATE_CLEANING_BY_ID_QUERY = """
-    UPDATE cleanings  
-    SET name         = :name,  
-        description  = :description,  
-        price        = :price,  
-        cleaning_type = :cleaning_type  
-    WHERE id = :id  
-    RETURNING id, name, description, price, cleaning_type;  
+    UPDATE cleanings
+    SET {set_columns}
+    WHERE id = :id
+    RETURNING id, name, description, price, cleaning_type;
 """
 
+# Deletes report what they removed through RETURNING, so a missing id
+# is detected from the empty result instead of a SELECT beforehand.
 DELETE_CLEANING_BY_ID_QUERY = """
-DELETE FROM cleanings
-WHERE id = :id
-RETURNING id;
+    DELETE FROM cleanings
+    WHERE id = :id
+    RETURNING id;
 """
 
+BULK_DELETE_CLEANINGS_QUERY = """
+    DELETE FROM cleanings
+    WHERE id = ANY(:ids)
+    RETURNING id;
+"""
+
+# (cleaning, etag) by id, shared by every CleaningsRepository in this process.
+# Any method that changes or removes a cleaning drops its entry, so a
+# worker only serves a stale cleaning when another worker changed it,
+# and then for at most CLEANINGS_CACHE_TTL_SECONDS.
+cleanings_cache = LRUCache(
+    max_size=CLEANINGS_CACHE_SIZE, ttl=CLEANINGS_CACHE_TTL_SECONDS
+)
+register_metrics("cleanings_cache", cleanings_cache.stats)
+
 
 class CleaningsRepository(BaseRepository):
     """ "
     All database actions associated with the Cleaning resource
     """
 
-    async def get_all_cleanings(self) -> List[CleaningPublic]:
-        cleaning_records = await self.db.fetch_all(query=GET_ALL_CLEANINGS_QUERY)
-        return [CleaningInDB(**l) for l in cleaning_records]
+    async def get_all_cleanings(
+        self,
+        *,
+        limit: int,
+        cursor: Optional[str] = None,
+        cleaning_type: Optional[CleaningType] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: CleaningSort = CleaningSort.id,
+    ) -> CleaningPage:
+        column, direction, parse_key = CLEANING_SORT_COLUMNS[sort]
+        # ask for one extra row so we know whether another page exists
+        values = {"limit": limit + 1}
+        conditions = ["TRUE"]
+
+        if cleaning_type is not None:
+            conditions.append("cleaning_type = :cleaning_type")
+            values["cleaning_type"] = cleaning_type
+        if min_price is not None:
+            conditions.append("price >= :min_price")
+            values["min_price"] = min_price
+        if max_price is not None:
+            conditions.append("price <= :max_price")
+            values["max_price"] = max_price
+
+        if cursor:
+            after = decode_cursor(cursor)
+            try:
+                if after.get("sort") != sort.value or not is_valid_id(after["id"]):
+                    raise ValueError
+                values["after_id"] = after["id"]
+                if column != "id":
+                    values["after_key"] = parse_key(after["key"])
+            except (KeyError, TypeError, ValueError, InvalidOperation):
+                raise HTTPException(
+                    status_code=HTTP_400_BAD_REQUEST,
+                    detail="Invalid pagination cursor.",
+                )
+
+            comparison = ">" if direction == "ASC" else "<"
+            if column == "id":
+                conditions.append(f"id {comparison} :after_id")
+            else:
+                # a row comparison lets postgres seek the (column, id)
+                # index directly, ties on the column are broken by id
+                conditions.append(
+                    f"({column}, id) {comparison} (:after_key, :after_id)"
+                )
+
+        order_by = f"id {direction}"
+        if column != "id":
+            order_by = f"{column} {direction}, {order_by}"
+
+        cleaning_records = await self.reader_db.fetch_all(
+            query=GET_ALL_CLEANINGS_QUERY.format(
+                sort_column=column,
+                conditions=" AND ".join(conditions),
+                order_by=order_by,
+            ),
+            values=values,
+        )
+        cleanings = [CleaningInDB(**l) for l in cleaning_records[:limit]]
+
+        next_cursor = None
+        if len(cleaning_records) > limit:
+            last = cleaning_records[limit - 1]
+            sort_key = last["sort_key"]
+            if isinstance(sort_key, datetime):
+                sort_key = sort_key.isoformat()
+            elif isinstance(sort_key, Decimal):
+                sort_key = str(sort_key)
+            next_cursor = encode_cursor(
+                {"sort": sort.value, "key": sort_key, "id": last["id"]}
+            )
+
+        return CleaningPage(cleanings=cleanings, next_cursor=next_cursor)
+
+    async def search_cleanings(
+        self, *, q: str, limit: int, cursor: Optional[str] = None
+    ) -> CleaningPage:
+        values = {"q": q, "limit": limit + 1}
+        after = "TRUE"
+
+        if cursor:
+            last = decode_cursor(cursor)
+            if not is_valid_rank(last.get("rank")) or not is_valid_id(last.get("id")):
+                raise HTTPException(
+                    status_code=HTTP_400_BAD_REQUEST,
+                    detail="Invalid pagination cursor.",
+                )
+            values["after_rank"] = last["rank"]
+            values["after_id"] = last["id"]
+            after = "(rank, id) < (:after_rank, :after_id)"
+
+        cleaning_records = await self.reader_db.fetch_all(
+            query=SEARCH_CLEANINGS_QUERY.format(after=after), values=values
+        )
+        cleanings = [CleaningInDB(**l) for l in cleaning_records[:limit]]
+
+        next_cursor = None
+        if len(cleaning_records) > limit:
+            last = cleaning_records[limit - 1]
+            next_cursor = encode_cursor({"rank": last["rank"], "id": last["id"]})
+
+        return CleaningPage(cleanings=cleanings, next_cursor=next_cursor)
+
+    async def iterate_all_cleanings(self) -> AsyncIterator[CleaningInDB]:
+        # Database.iterate runs the query through a server side cursor
+        # inside a transaction, so rows arrive from postgres in small
+        # batches instead of the whole table being buffered in memory.
+        async for record in self.reader_db.iterate(query=EXPORT_CLEANINGS_QUERY):
+            yield CleaningInDB(**record)
 
     async def create_cleaning(self, *, new_cleaning: CleaningCreate) -> CleaningInDB:
         query_values = new_cleaning.dict()
@@ -70,60 +297,126 @@ class CleaningsRepository(BaseRepository):
 
         return CleaningInDB(**cleaning)
 
+    async def bulk_create_cleanings(
+        self, *, new_cleanings: List[CleaningCreate]
+    ) -> List[int]:
+        created_ids = []
+        # all or nothing: a bad row anywhere rolls back every chunk
+        try:
+            async with self.db.transaction():
+                for start in range(0, len(new_cleanings), CLEANINGS_BULK_CHUNK_SIZE):
+                    chunk = new_cleanings[start : start + CLEANINGS_BULK_CHUNK_SIZE]
+                    records = await self.db.fetch_all(
+                        query=BULK_CREATE_CLEANINGS_QUERY,
+                        values={
+                            "names": [c.name for c in chunk],
+                            "descriptions": [c.description for c in chunk],
+                            "prices": [c.price for c in chunk],
+                            "cleaning_types": [c.cleaning_type for c in chunk],
+                        },
+                    )
+                    created_ids.extend(record["id"] for record in records)
+        except (DataError, IntegrityConstraintViolationError):
+            # same as update_cleaning: a row postgres won't store, e.g. a
+            # null cleaning_type or a price out of range
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST, detail="Invalid cleaning params."
+            )
+
+        return created_ids
+
     async def get_cleaning_by_id(self, *, id: int) -> CleaningInDB:
-        cleaning = await self.db.fetch_one(GET_CLEANING_BY_ID_QUERY, values={"id": id})
+        cleaning, _ = await self.get_cleaning_and_etag_by_id(id=id)
+        return cleaning
 
-        if not cleaning:
-            return None
+    async def get_cleaning_and_etag_by_id(
+        self, *, id: int
+    ) -> Tuple[Optional[CleaningInDB], Optional[str]]:
+        """
+        The cleaning along with an ETag for its current version. The
+        ETag comes from updated_at, which the update_cleanings_modtime
+        trigger bumps on every change.
+        """
+        cached = cleanings_cache.get(id) if self.reads_cache else None
+        if cached:
+            cleaning, etag = cached
+            return cleaning.copy(), etag
 
-        return CleaningInDB(**cleaning)
+        record = await self.reader_db.fetch_one(
+            GET_CLEANING_BY_ID_QUERY, values={"id": id}
+        )
+
+        if not record:
+            return None, None
+
+        cleaning = CleaningInDB(**record)
+        etag = make_etag("cleaning", id, record["updated_at"].isoformat())
+        if self.fills_cache:
+            cleanings_cache.set(id, (cleaning, etag))
+        return cleaning.copy(), etag
 
     async def update_cleaning(
         self, *, id: int, cleaning_update: CleaningUpdate
     ) -> CleaningInDB:
-        cleaning = await self.get_cleaning_by_id(id=id)
-
-        if not cleaning:
-            return None
-
         """
-        As specified in pydantic docs, we can call the .copy() method 
-        on the model and pass any changes we'd like to make to the 
-        update parameter. Pydantic indicates that update should be 
-        "a dictionary of values to change when creating the copied model", 
-        and we obtain that by calling the .dict() method on the CleaningUpdate 
-        model we received in our PUT route. By specifying exclude_unset=True, 
-        Pydantic will leave out any attributes that were not explicitly 
-        set when the model was created.
+        By specifying exclude_unset=True, Pydantic will leave out any
+        attributes that were not explicitly set when the model was
+        created, so update_params holds exactly the columns to change.
         """
-        cleaning_update_params = cleaning.copy(
-            update=cleaning_update.dict(exclude_unset=True)
-        )
+        update_params = cleaning_update.dict(exclude_unset=True)
 
         # Note that because we listed "cleaning_type" with an
         # Optional type specification in our CleaningUpdate
         # Any time a user pass None as the cleaning_type,
         # throw an error.
-        if cleaning_update_params.cleaning_type is None:
+        if "cleaning_type" in update_params and update_params["cleaning_type"] is None:
             raise HTTPException(
                 status_code=HTTP_400_BAD_REQUEST,
                 detail="Invalid cleaning type. Cannot be None.",
             )
+
+        # nothing to change, hand back the cleaning as it is
+        if not update_params:
+            return await self.get_cleaning_by_id(id=id)
+
+        # the column names come from the CleaningUpdate model fields,
+        # never from the request body keys, so they are safe to inline
+        set_columns = ", ".join(f"{column} = :{column}" for column in update_params)
         try:
             updated_cleaning = await self.db.fetch_one(
-                query=UPDATE_CLEANING_BY_ID_QUERY, values=cleaning_update_params.dict()
+                query=UPDATE_CLEANING_BY_ID_QUERY.format(set_columns=set_columns),
+                values={**update_params, "id": id},
             )
-            return CleaningInDB(**updated_cleaning)
-        except Exception as e:
-            print(e)
+        except (DataError, IntegrityConstraintViolationError):
+            # values postgres won't store, e.g. a price out of range or a
+            # required column set to null. Timeouts, cancellations and
+            # connection errors keep their own status codes.
             raise HTTPException(
                 status_code=HTTP_400_BAD_REQUEST, detail="Invalid update params."
             )
 
+        call_on_commit(cleanings_cache.delete, id)
+        if not updated_cleaning:
+            return None
+
+        return CleaningInDB(**updated_cleaning)
+
     async def delete_cleaning_by_id(self, *, id: int) -> int:
-        cleaning = await self.get_cleaning_by_id(id=id)
-        if not cleaning:
+        deleted = await self.db.fetch_one(
+            query=DELETE_CLEANING_BY_ID_QUERY, values={"id": id}
+        )
+        call_on_commit(cleanings_cache.delete, id)
+        if not deleted:
             return None
 
-        deleted_id = await self.db.execute(query=DELETE_CLEANING_BY_ID_QUERY)
-        return deleted_id
\ No newline at end of file
+        return deleted["id"]
+
+    async def bulk_delete_cleanings(self, *, ids: List[int]) -> List[int]:
+        deleted = await self.db.fetch_all(
+            query=BULK_DELETE_CLEANINGS_QUERY, values={"ids": ids}
+        )
+        deleted_ids = [record["id"] for record in deleted]
+        for id in deleted_ids:
+            call_on_commit(cleanings_cache.delete, id)
+
+        return deleted_ids
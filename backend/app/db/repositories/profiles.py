@@ -1,6 +1,10 @@
+from typing import List
+
 from app.db.repositories.base import BaseRepository
+from app.db.unit_of_work import call_on_commit
 from app.models.profile import ProfileCreate, ProfilePublic, ProfileUpdate, ProfileInDB
 from app.models.user import UserInDB
+from app.services.authentication import authenticated_users_cache
 
 CREATE_PROFILE_FOR_USER_QUERY = """
     INSERT INTO profiles (full_name, phone_number, bio, image, user_id)
@@ -31,12 +35,46 @@ GET_PROFILE_BY_USERNAME_QUERY = """
     WHERE user_id = (SELECT id FROM users WHERE username = :username);
 """
 
+GET_PROFILES_BY_USERNAMES_QUERY = """
+    SELECT p.id,
+           u.email AS email,
+           u.username AS username,
+           full_name,
+           phone_number,
+           bio,
+           image,
+           user_id,
+           p.created_at,
+           p.updated_at
+    FROM users u
+        INNER JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.username = ANY(:usernames);
+"""
+
+GET_PROFILES_BY_USER_IDS_QUERY = """
+    SELECT p.id,
+           u.email AS email,
+           u.username AS username,
+           full_name,
+           phone_number,
+           bio,
+           image,
+           user_id,
+           p.created_at,
+           p.updated_at
+    FROM users u
+        INNER JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.id = ANY(:user_ids);
+"""
+
+# Only the columns present in the update are set, in the same statement
+# that finds the row, so concurrent edits to different fields of one
+# profile no longer overwrite each other.
 UPDATE_PROFILE_QUERY = """
     UPDATE profiles
-    SET full_name    = :full_name,
-        phone_number = :phone_number,
-        bio          = :bio,
-        image        = :image
+    SET {set_columns}
     WHERE user_id = :user_id
     RETURNING id, full_name, phone_number, bio, image, user_id, created_at, updated_at;
 """
@@ -46,23 +84,69 @@ class ProfilesRepository(BaseRepository):
     async def update_profile(
         self, *, profile_update: ProfileUpdate, requesting_user: UserInDB
     ) -> ProfileInDB:
-        profile = await self.get_profile_by_user_id(user_id=requesting_user.id)
-        update_params = profile.copy(update=profile_update.dict(exclude_unset=True))
-        updated_profile = await self.db.fetch_one(
-            query=UPDATE_PROFILE_QUERY,
-            values=update_params.dict(
-                exclude={"id", "created_at", "updated_at", "username", "email"}
-            ),
-        )
-        return ProfileInDB(**updated_profile)
+        update_params = profile_update.dict(exclude_unset=True)
+
+        if update_params:
+            # column names come from the ProfileUpdate fields, so they are
+            # safe to inline
+            set_columns = ", ".join(f"{column} = :{column}" for column in update_params)
+            profile_record = await self.db.fetch_one(
+                query=UPDATE_PROFILE_QUERY.format(set_columns=set_columns),
+                values={**update_params, "user_id": requesting_user.id},
+            )
+            profile = ProfileInDB(**profile_record) if profile_record else None
+        else:
+            profile = await self.get_profile_by_user_id(user_id=requesting_user.id)
+
+        # users registered before profiles existed have no row yet, so the
+        # update creates one for them
+        if not profile:
+            profile_create = ProfileCreate(**update_params, user_id=requesting_user.id)
+            profile = await self.create_profile_for_user(profile_create=profile_create)
+            profile = ProfileInDB(**profile)
+
+        call_on_commit(authenticated_users_cache.delete, requesting_user.username)
+        return profile
 
     async def get_profile_by_username(self, *, username: str) -> ProfileInDB:
-        profile_record = await self.db.fetch_one(
+        profile_record = await self.reader_db.fetch_one(
             query=GET_PROFILE_BY_USERNAME_QUERY, values={"username": username}
         )
         if profile_record:
             return ProfileInDB(**profile_record)
 
+    async def get_profiles_by_usernames(
+        self, *, usernames: List[str]
+    ) -> List[ProfileInDB]:
+        """
+        Look up every username with one query and hand the profiles back in
+        the order they were asked for. Usernames without a profile are left out.
+        """
+        profile_records = await self.reader_db.fetch_all(
+            query=GET_PROFILES_BY_USERNAMES_QUERY, values={"usernames": usernames}
+        )
+        profiles = {record["username"]: record for record in profile_records}
+
+        return [
+            ProfileInDB(**profiles[username])
+            for username in usernames
+            if username in profiles
+        ]
+
+    async def get_profiles_by_user_ids(
+        self, *, user_ids: List[int]
+    ) -> List[ProfileInDB]:
+        profile_records = await self.reader_db.fetch_all(
+            query=GET_PROFILES_BY_USER_IDS_QUERY, values={"user_ids": user_ids}
+        )
+        profiles = {record["user_id"]: record for record in profile_records}
+
+        return [
+            ProfileInDB(**profiles[user_id])
+            for user_id in user_ids
+            if user_id in profiles
+        ]
+
     async def create_profile_for_user(
         self, *, profile_create: ProfileCreate
     ) -> ProfileInDB:
@@ -73,7 +157,7 @@ class ProfilesRepository(BaseRepository):
         return created_profile
 
     async def get_profile_by_user_id(self, *, user_id: int) -> ProfileInDB:
-        profile_record = await self.db.fetch_one(
+        profile_record = await self.reader_db.fetch_one(
             query=GET_PROFILE_BY_USER_ID_QUERY, values={"user_id": user_id}
         )
 
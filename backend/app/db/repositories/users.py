@@ -1,11 +1,11 @@
-from typing import Optional
+from typing import Mapping, Optional
+from asyncpg.exceptions import UniqueViolationError
 from fastapi import HTTPException, status
 from pydantic import EmailStr
 from databases import Database
 
 from app.db.repositories.base import BaseRepository
-from app.db.repositories.profiles import ProfilesRepository
-from app.models.profile import ProfileCreate, ProfilePublic
+from app.models.profile import ProfilePublic
 from app.models.user import UserCreate, UserInDB, UserUpdate, UserPublic
 from app.services import auth_service
 
@@ -21,96 +21,226 @@ GET_USER_BY_USERNAME_QUERY = """
     WHERE username = :username
 """
 
-REGISTER_NEW_USER_QUERY = """
-    INSERT INTO users (username, email, password, salt)
-    VALUES (:username, :email, :password, :salt)
+GET_USER_BY_ID_QUERY = """
+    SELECT id, username, email, email_verified, password, salt, is_active, is_superuser, created_at, updated_at
+    FROM users
+    WHERE id = :id
+"""
+
+# Populated lookups fetch the user and their profile in one round trip.
+# Profile columns are prefixed with profile_ and are all NULL when the
+# user has no profile row yet.
+USER_WITH_PROFILE_COLUMNS = """
+    u.id, u.username, u.email, u.email_verified, u.password, u.salt,
+    u.is_active, u.is_superuser, u.created_at, u.updated_at,
+    p.id AS profile_id,
+    p.full_name AS profile_full_name,
+    p.phone_number AS profile_phone_number,
+    p.bio AS profile_bio,
+    p.image AS profile_image,
+    p.user_id AS profile_user_id,
+    p.created_at AS profile_created_at,
+    p.updated_at AS profile_updated_at
+"""
+
+GET_USER_WITH_PROFILE_BY_EMAIL_QUERY = f"""
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM users u
+        LEFT JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.email = :email
+"""
+
+GET_USER_WITH_PROFILE_BY_USERNAME_QUERY = f"""
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM users u
+        LEFT JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.username = :username
+"""
+
+GET_USER_WITH_PROFILE_BY_ID_QUERY = f"""
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM users u
+        LEFT JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.id = :id
+"""
+
+# Checked before the password is hashed, so signing up with a taken
+# email or username doesn't cost a bcrypt run.
+CHECK_USER_CREDENTIALS_TAKEN_QUERY = """
+    SELECT EXISTS (SELECT 1 FROM users WHERE email = :email) AS email_taken,
+           EXISTS (SELECT 1 FROM users WHERE username = :username) AS username_taken
+"""
+
+# Registration in one statement: the user, their empty profile and the
+# populated result all come out of a single round trip, and being one
+# statement it either creates both rows or neither. Sign ups racing for
+# the same email or username past the check above are caught by the
+# unique indexes on users.
+REGISTER_NEW_USER_QUERY = f"""
+    WITH u AS (
+        INSERT INTO users (username, email, password, salt)
+        VALUES (:username, :email, :password, :salt)
+        RETURNING id, username, email, email_verified, password, salt, is_active, is_superuser, created_at, updated_at
+    ), p AS (
+        INSERT INTO profiles (user_id)
+        SELECT id FROM u
+        RETURNING id, full_name, phone_number, bio, image, user_id, created_at, updated_at
+    )
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM u
+        LEFT JOIN p
+        ON p.user_id = u.id
+"""
+
+UPDATE_USER_PASSWORD_QUERY = """
+    UPDATE users
+    SET password = :password,
+        salt     = :salt
+    WHERE id = :id
     RETURNING id, username, email, email_verified, password, salt, is_active, is_superuser, created_at, updated_at;
 """
 
+# unique index violated on insert -> the 400 detail to send back
+TAKEN_USER_CREDENTIAL_DETAILS = {
+    "ix_users_email": "That email is already taken. Login with that email or register wih another one.",
+    "ix_users_username": "That username is already taken. Please try another one.",
+}
+
+
+def raise_credential_taken(index_name: str) -> None:
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=TAKEN_USER_CREDENTIAL_DETAILS[index_name],
+    )
+
 
 class UsersRepository(BaseRepository):
-    def __init__(self, db: Database) -> None:
-        super().__init__(db)
+    def __init__(
+        self,
+        db: Database,
+        reader_db: Optional[Database] = None,
+        *,
+        use_cache: bool = True,
+    ) -> None:
+        super().__init__(db, reader_db, use_cache=use_cache)
         self.auth_service = auth_service
-        self.profiles_repo = ProfilesRepository(db)
 
     async def get_user_by_email(
         self, *, email: EmailStr, populate: bool = True
     ) -> UserInDB:
-        user_record = await self.db.fetch_one(
-            query=GET_USER_BY_EMAIL_QUERY, values={"email": email}
+        user_record = await self.reader_db.fetch_one(
+            query=GET_USER_WITH_PROFILE_BY_EMAIL_QUERY
+            if populate
+            else GET_USER_BY_EMAIL_QUERY,
+            values={"email": email},
         )
 
         if user_record:
-            user = UserInDB(**user_record)
-            if populate:
-                return await self.populate_user(user=user)
-
-            return user
+            return self.build_user(user_record=user_record, populate=populate)
 
     async def get_user_by_username(
         self, *, username: str, populate: bool = True
     ) -> UserInDB:
-        user_record = await self.db.fetch_one(
-            query=GET_USER_BY_USERNAME_QUERY, values={"username": username}
+        user_record = await self.reader_db.fetch_one(
+            query=GET_USER_WITH_PROFILE_BY_USERNAME_QUERY
+            if populate
+            else GET_USER_BY_USERNAME_QUERY,
+            values={"username": username},
         )
 
         if user_record:
-            user = UserInDB(**user_record)
-            if populate:
-                return await self.populate_user(user=user)
-            return user
+            return self.build_user(user_record=user_record, populate=populate)
+
+    async def get_user_by_id(self, *, id: int, populate: bool = True) -> UserInDB:
+        user_record = await self.reader_db.fetch_one(
+            query=GET_USER_WITH_PROFILE_BY_ID_QUERY
+            if populate
+            else GET_USER_BY_ID_QUERY,
+            values={"id": id},
+        )
 
-    async def register_new_user(self, *, new_user: UserCreate) -> UserInDB:
-        # make sure email isn't already taken
-        if await self.get_user_by_email(email=new_user.email):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="That email is already taken. Login with that email or register wih another one.",
-            )
+        if user_record:
+            return self.build_user(user_record=user_record, populate=populate)
 
-        # make sure username isn't already taken
-        if await self.get_user_by_username(username=new_user.username):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="That username is already taken. Please try another one.",
+    async def register_new_user(self, *, new_user: UserCreate) -> UserInDB:
+        # Read outside of the unit of work, so no connection is held while
+        # the password hashes. Anything a lagging replica lets through is
+        # still caught by the unique indexes.
+        taken = await self.reader_db.fetch_one(
+            query=CHECK_USER_CREDENTIALS_TAKEN_QUERY,
+            values={"email": new_user.email, "username": new_user.username},
+        )
+        if taken["email_taken"]:
+            raise_credential_taken("ix_users_email")
+        if taken["username_taken"]:
+            raise_credential_taken("ix_users_username")
+
+        user_password_update = (
+            await self.auth_service.create_salt_and_hashed_password_async(
+                plaintext_password=new_user.password
             )
-
-        user_password_update = self.auth_service.create_salt_and_hashed_password(
-            plaintext_password=new_user.password
         )
         new_user_params = new_user.copy(update=user_password_update.dict())
-        created_user = await self.db.fetch_one(
-            query=REGISTER_NEW_USER_QUERY, values=new_user_params.dict()
-        )
 
-        # create a profile for the user
-        await self.profiles_repo.create_profile_for_user(
-            profile_create=ProfileCreate(user_id=created_user["id"])
-        )
+        try:
+            created_user = await self.db.fetch_one(
+                query=REGISTER_NEW_USER_QUERY, values=new_user_params.dict()
+            )
+        except UniqueViolationError as e:
+            if e.constraint_name not in TAKEN_USER_CREDENTIAL_DETAILS:
+                raise
+            raise_credential_taken(e.constraint_name)
 
-        return await self.populate_user(user=UserInDB(**created_user))
+        return self.build_user(user_record=created_user, populate=True)
 
     async def authenticate_user(
         self, *, email: EmailStr, password: str
     ) -> Optional[UserInDB]:
         # make user user exists in db
         user = await self.get_user_by_email(email=email, populate=False)
-        print(user)
         if not user:
             return None
         # if submitted password doesn't match
-        if not self.auth_service.verify_password(
+        if not await self.auth_service.verify_password_async(
             password=password, salt=user.salt, hashed_pw=user.password
         ):
             return None
+
+        # The password was hashed with an old scheme or cost. This is the
+        # only moment we hold the plaintext, so bring the hash up to date.
+        if self.auth_service.password_needs_rehash(hashed_pw=user.password):
+            user = await self.update_user_password(user=user, password=password)
+
         return user
 
-    async def populate_user(self, *, user: UserInDB) -> UserInDB:
-        return UserPublic(
-            # unpack the user in db dict into the UserPublic model
-            # which will remove "password" and "salt"
-            **user.dict(),
-            # fetch the user's profile from the profiles repo
-            profile=await self.profiles_repo.get_profile_by_user_id(user_id=user.id)
-        )
\ No newline at end of file
+    async def update_user_password(self, *, user: UserInDB, password: str) -> UserInDB:
+        user_password_update = (
+            await self.auth_service.create_salt_and_hashed_password_async(
+                plaintext_password=password
+            )
+        )
+        updated_user = await self.db.fetch_one(
+            query=UPDATE_USER_PASSWORD_QUERY,
+            values={**user_password_update.dict(), "id": user.id},
+        )
+        return UserInDB(**updated_user)
+
+    def build_user(self, *, user_record: Mapping, populate: bool) -> UserInDB:
+        user = UserInDB(**user_record)
+        if not populate:
+            return user
+
+        profile = None
+        if user_record["profile_id"] is not None:
+            profile = ProfilePublic(
+                **{
+                    column[len("profile_") :]: value
+                    for column, value in user_record.items()
+                    if column.startswith("profile_")
+                }
+            )
+
+        return UserPublic(**user.dict(), profile=profile)
@@ -1,28 +1,63 @@
 import os
 from fastapi import FastAPI
 from databases import Database
-from app.core.config import DATABASE_URL
+from app.core.config import (
+    DATABASE_REPLICA_URLS,
+    DATABASE_URL,
+    DB_POOL_ACQUIRE_TIMEOUT_SECONDS,
+    DB_POOL_MAX_IDLE_SECONDS,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+)
+from app.core.metrics import register_metrics
+from app.db.instrumentation import InstrumentedDatabase
+from app.db.pool import instrument_pool
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+async def connect_database(url: str, *, metrics_name: str) -> Database:
+    database = InstrumentedDatabase(
+        url,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_IDLE_SECONDS,
+    )
+    await database.connect()
+    pool = instrument_pool(database, acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT_SECONDS)
+    register_metrics(metrics_name, pool.stats)
+    return database
+
+
 async def connect_to_db(app: FastAPI) -> None:
     # handle testing and non-testing connects
     # This helps us use the testing database
     # for our testing session, and our regular database otherwise.
 
     DB_URL = f"{DATABASE_URL}_test" if os.environ.get("TESTING") else DATABASE_URL
-    database = Database(DB_URL, min_size=2, max_size=10)
 
     try:
-        await database.connect()
-        app.state._db = database
+        app.state._db = await connect_database(DB_URL, metrics_name="db_pool")
     except Exception as e:
         logger.warn("--- DB CONNECTION ERROR ---")
         logger.warn(e)
         logger.warn("--- DB CONNECTION ERROR ---")
 
+    # a replica that cannot be reached is left out, its share of the
+    # reads goes to the others or to the primary
+    app.state._replica_dbs = []
+    for index, replica_url in enumerate(DATABASE_REPLICA_URLS):
+        try:
+            replica = await connect_database(
+                replica_url, metrics_name=f"db_replica_pool_{index}"
+            )
+            app.state._replica_dbs.append(replica)
+        except Exception as e:
+            logger.warning("--- DB REPLICA CONNECTION ERROR ---")
+            logger.warning(e)
+            logger.warning("--- DB REPLICA CONNECTION ERROR ---")
+
 
 async def close_db_connection(app: FastAPI) -> None:
     try:
@@ -31,3 +66,12 @@ async def close_db_connection(app: FastAPI) -> None:
         logger.warn("--- DB DISCONNECT ERROR ---")
         logger.warn(e)
         logger.warn("--- DB DISCONNECT ERROR ---")
+
+    # each replica on its own, one failing must not leave the rest open
+    for replica in getattr(app.state, "_replica_dbs", []):
+        try:
+            await replica.disconnect()
+        except Exception as e:
+            logger.warning("--- DB REPLICA DISCONNECT ERROR ---")
+            logger.warning(e)
+            logger.warning("--- DB REPLICA DISCONNECT ERROR ---")
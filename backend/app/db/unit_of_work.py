@@ -0,0 +1,148 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, List, Mapping, Optional
+
+from databases import Database
+from databases.core import Connection, Transaction
+
+# the transactional unit of work of the request being handled, if any
+_current_unit_of_work: ContextVar[Optional["UnitOfWork"]] = ContextVar(
+    "current_unit_of_work", default=None
+)
+
+
+def call_on_commit(callback: Callable, *args: Any) -> None:
+    """
+    Run callback once the current request's transaction commits, or
+    straight away outside of one. Used to drop cache entries: dropping
+    them before the commit would let a concurrent read cache the old row
+    again, and after a rollback there is nothing to drop.
+    """
+    unit_of_work = _current_unit_of_work.get()
+    if unit_of_work is None:
+        callback(*args)
+    else:
+        unit_of_work.on_commit.append((callback, args))
+
+
+class UnitOfWork:
+    """
+    Holds one pool connection for the length of a request and, when the
+    request writes, one transaction on it. databases hands every query
+    made from the same task the same Connection, so repositories built on
+    this Database run on the pinned connection and inside the transaction
+    without knowing about it.
+
+    Nothing is checked out until the first query through self.db, so a
+    request answered from a cache, or one still waiting for a password
+    hash, doesn't hold a connection. The statement timeout is worked out
+    at that point too, from what is left of the request's budget.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        *,
+        transactional: bool,
+        statement_timeout_ms: Callable[[], Optional[int]] = lambda: None,
+    ) -> None:
+        self.database = db
+        self.db = UnitOfWorkDatabase(self, db)
+        self.transactional = transactional
+        self.statement_timeout_ms = statement_timeout_ms
+        self._connection: Optional[Connection] = None
+        self._transaction: Optional[Transaction] = None
+        self._finished = False
+        self.on_commit: List[Any] = []
+
+    async def begin(self) -> None:
+        # Queries after the unit of work has finished, such as those of a
+        # response still streaming, each run on a connection of their own.
+        if self._connection is not None or self._finished:
+            return
+
+        connection = self.database.connection()
+        await connection.__aenter__()
+        self._connection = connection
+        if self.transactional:
+            self._transaction = await self.database.transaction().start()
+            _current_unit_of_work.set(self)
+
+        statement_timeout_ms = self.statement_timeout_ms()
+        if statement_timeout_ms is not None:
+            # SET LOCAL ends with the transaction. Without one the setting
+            # lasts for the session, which asyncpg resets (RESET ALL) when
+            # the connection goes back to the pool.
+            # Run on the connection itself, which isn't instrumented, so the
+            # SET isn't timed as one of the caller's queries.
+            scope = "LOCAL " if self.transactional else ""
+            await connection.execute(
+                f"SET {scope}statement_timeout = {max(int(statement_timeout_ms), 1)}"
+            )
+
+    async def commit(self) -> None:
+        await self._finish(commit=True)
+
+    async def rollback(self) -> None:
+        await self._finish(commit=False)
+
+    async def _finish(self, *, commit: bool) -> None:
+        # safe to call more than once, and before begin
+        self._finished = True
+        connection, self._connection = self._connection, None
+        transaction, self._transaction = self._transaction, None
+        on_commit, self.on_commit = self.on_commit, []
+        if transaction is not None:
+            _current_unit_of_work.set(None)
+
+        try:
+            if transaction is not None:
+                if commit:
+                    await transaction.commit()
+                else:
+                    await transaction.rollback()
+        finally:
+            if connection is not None:
+                await connection.__aexit__()
+
+        if transaction is not None and commit:
+            for callback, args in on_commit:
+                callback(*args)
+
+
+class UnitOfWorkDatabase:
+    """
+    The database handed to repositories within a unit of work. Each call
+    begins the unit of work if it hasn't yet, then goes to the Database.
+    """
+
+    def __init__(self, unit_of_work: UnitOfWork, database: Database) -> None:
+        self.unit_of_work = unit_of_work
+        self.database = database
+
+    async def fetch_all(self, query: Any, values: dict = None) -> List[Mapping]:
+        await self.unit_of_work.begin()
+        return await self.database.fetch_all(query, values)
+
+    async def fetch_one(self, query: Any, values: dict = None) -> Optional[Mapping]:
+        await self.unit_of_work.begin()
+        return await self.database.fetch_one(query, values)
+
+    async def fetch_val(self, query: Any, values: dict = None, column: Any = 0) -> Any:
+        await self.unit_of_work.begin()
+        return await self.database.fetch_val(query, values, column)
+
+    async def execute(self, query: Any, values: dict = None) -> Any:
+        await self.unit_of_work.begin()
+        return await self.database.execute(query, values)
+
+    async def iterate(self, query: Any, values: dict = None) -> AsyncIterator[Mapping]:
+        await self.unit_of_work.begin()
+        async for record in self.database.iterate(query, values):
+            yield record
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        await self.unit_of_work.begin()
+        async with self.database.transaction():
+            yield
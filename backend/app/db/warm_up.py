@@ -0,0 +1,86 @@
+import asyncio
+import importlib
+import logging
+import pkgutil
+from typing import Any, Dict
+
+from databases import Database
+from sqlalchemy import text
+
+import app.db.repositories
+
+logger = logging.getLogger(__name__)
+
+
+def repository_queries() -> Dict[str, str]:
+    """
+    Every *_QUERY constant defined in app/db/repositories, keyed by
+    "<module>.<constant>"
+    """
+    queries = {}
+    for module_info in pkgutil.iter_modules(app.db.repositories.__path__):
+        module = importlib.import_module(f"app.db.repositories.{module_info.name}")
+        for name, value in vars(module).items():
+            if name.endswith("_QUERY") and isinstance(value, str):
+                queries[f"{module_info.name}.{name}"] = value
+
+    return queries
+
+
+def repository_statements(database: Database) -> Dict[str, str]:
+    """
+    The repository queries as databases hands them to asyncpg, with
+    :name params turned into $n. Templates only take their final shape
+    per request, so they are left out.
+    """
+    backend_connection = database._backend.connection()
+    return {
+        name: backend_connection._compile(text(query))[0]
+        for name, query in repository_queries().items()
+        if "{" not in query
+    }
+
+
+async def warm_up_database(database: Database) -> int:
+    """
+    Check out the pool's minimum number of connections at once, so all of
+    them are open, and prepare every repository statement on each. asyncpg
+    keeps prepared statements in a cache per connection, so first requests
+    skip the parse and plan round trip.
+
+    Returns the number of statements prepared. One that fails to prepare
+    is logged and left for the first request that needs it.
+    """
+    statements = repository_statements(database)
+    pool = database._backend._pool
+    connections = await asyncio.gather(
+        *(pool.acquire() for _ in range(pool.get_min_size()))
+    )
+    failed: Dict[str, Exception] = {}
+
+    async def prepare_all(connection: Any) -> int:
+        prepared = 0
+        for name, statement in statements.items():
+            try:
+                # the same lookup asyncpg does for fetch and execute, which
+                # fills its statement cache on a miss
+                await connection._get_statement(statement, None)
+            except Exception as e:
+                failed[name] = e
+            else:
+                prepared += 1
+
+        return prepared
+
+    try:
+        prepared = await asyncio.gather(
+            *(prepare_all(connection) for connection in connections)
+        )
+    finally:
+        for connection in connections:
+            await pool.release(connection)
+
+    for name, e in failed.items():
+        logger.warning("Could not prepare %s: %s", name, e)
+
+    return sum(prepared)
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 
 from app.models.core import CoreModel, IDModelMixin
@@ -22,6 +22,17 @@ class CleaningType(str, Enum):
     full_clean = "full_clean"
 
 
+# Orderings the cleanings list can be requested in. A leading "-" means
+# descending. Every ordering is backed by an index, see the
+# add_cleanings_list_indexes migration.
+class CleaningSort(str, Enum):
+    id = "id"
+    price = "price"
+    price_desc = "-price"
+    created_at = "created_at"
+    created_at_desc = "-created_at"
+
+
 class CleaningBase(CoreModel):
     """
     All common characteristics of our Cleaning resource
@@ -54,3 +65,13 @@ class CleaningInDB(IDModelMixin, CleaningBase):
 
 class CleaningPublic(IDModelMixin, CleaningBase):
     pass
+
+
+class CleaningPage(CoreModel):
+    """
+    One page of cleanings. Pass next_cursor back as the cursor query
+    param to fetch the following page; it is None on the last page.
+    """
+
+    cleanings: List[CleaningPublic]
+    next_cursor: Optional[str]
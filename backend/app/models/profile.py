@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import EmailStr, HttpUrl
 from app.models.core import DateTimeModelMixin, IDModelMixin, CoreModel
@@ -45,4 +45,15 @@ class ProfileInDB(IDModelMixin, DateTimeModelMixin, ProfileBase):
 
 
 class ProfilePublic(ProfileInDB):
-    pass
\ No newline at end of file
+    pass
+
+
+class ProfileBatch(CoreModel):
+    """
+    Profiles found by a batch lookup, in the order they were asked for,
+    along with the usernames or user ids that matched no profile
+    """
+
+    profiles: List[ProfilePublic]
+    missing_usernames: List[str] = []
+    missing_user_ids: List[int] = []
@@ -1,5 +1,10 @@
+import asyncio
+import functools
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Type
+from typing import Any, Callable, Dict, Optional, Sequence, Type
 
 import bcrypt
 import jwt
@@ -10,17 +15,117 @@ from pydantic.error_wrappers import ValidationError
 
 from app.models.user import UserBase, UserPasswordUpdate
 
+from app.core.cache import LRUCache
 from app.core.config import (
+    ACCESS_TOKEN_CACHE_SIZE,
     ACCESS_TOKEN_EXPIRE_MINUTES,
+    AUTH_USER_CACHE_SIZE,
+    AUTH_USER_CACHE_TTL_SECONDS,
     JWT_ALGORITHM,
     JWT_AUDIENCE,
     JWT_TOKEN_PREFIX,
+    PASSWORD_HASH_MAX_QUEUE,
+    PASSWORD_HASH_ROUNDS,
+    PASSWORD_HASH_SCHEMES,
+    PASSWORD_HASH_WORKERS,
     SECRET_KEY,
 )
+from app.core.metrics import register_metrics
 from app.models.token import JWTCreds, JWTMeta, JWTPayload
 from app.models.user import UserInDB, UserPasswordUpdate
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def make_password_context(*, schemes: Sequence[str], rounds: int) -> CryptContext:
+    """
+    New hashes use the first scheme at exactly `rounds`. Hashes made with
+    any other scheme or cost still verify, but needs_update flags them so
+    they can be replaced on the next successful login.
+    """
+    default_scheme = schemes[0]
+    return CryptContext(
+        schemes=list(schemes),
+        default=default_scheme,
+        deprecated="auto",
+        **{
+            f"{default_scheme}__default_rounds": rounds,
+            f"{default_scheme}__min_rounds": rounds,
+            f"{default_scheme}__max_rounds": rounds,
+        },
+    )
+
+
+pwd_context = make_password_context(
+    schemes=PASSWORD_HASH_SCHEMES, rounds=PASSWORD_HASH_ROUNDS
+)
+
+
+class PasswordHashPool:
+    """
+    Bounded thread pool for bcrypt. A single hash or verify takes a few
+    hundred milliseconds of CPU, which would stall every other request
+    on the worker if it ran on the event loop. bcrypt releases the GIL
+    while it works, so threads are enough to take it off the loop.
+
+    At most max_workers calls run at once and max_queue more may wait.
+    Anything past that is turned away with a 503 straight away rather
+    than piling up behind a burst of logins.
+    """
+
+    def __init__(self, *, max_workers: int, max_queue: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hash"
+        )
+
+    async def run(self, fn: Callable, **kwargs: Any) -> Any:
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many password checks in progress. Try again shortly.",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(fn, **kwargs)
+            )
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": min(self.pending, self.max_workers),
+            "queued": max(self.pending - self.max_workers, 0),
+            "rejected": self.rejected,
+        }
+
+
+password_hash_pool = PasswordHashPool(
+    max_workers=PASSWORD_HASH_WORKERS, max_queue=PASSWORD_HASH_MAX_QUEUE
+)
+register_metrics("password_hashing", password_hash_pool.stats)
+
+# Populated users by username, filled by get_user_from_token. Anything
+# that changes a user or their profile must drop the username here.
+authenticated_users_cache = LRUCache(
+    max_size=AUTH_USER_CACHE_SIZE, ttl=AUTH_USER_CACHE_TTL_SECONDS
+)
+register_metrics("authenticated_users_cache", authenticated_users_cache.stats)
+
+# Usernames of access tokens that already passed signature, audience and
+# payload checks, keyed by a hash of the secret and the token so the raw
+# token is never held in memory and a token checked against one secret
+# is never trusted under another. Entries live until the token expires.
+access_token_cache = LRUCache(max_size=ACCESS_TOKEN_CACHE_SIZE, ttl=0)
+register_metrics("access_token_cache", access_token_cache.stats)
 
 
 class AuthException(BaseException):
@@ -31,6 +136,11 @@ class AuthException(BaseException):
 
 class AuthService:
     def get_username_from_token(self, *, token: str, secret_key: str) -> Optional[str]:
+        cache_key = hashlib.sha256(f"{secret_key}:{token}".encode()).hexdigest()
+        username = access_token_cache.get(cache_key)
+        if username:
+            return username
+
         try:
             decoded_token = jwt.decode(
                 token,
@@ -45,8 +155,20 @@ class AuthService:
                 detail="Could not validate token credentials.",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+
+        expires_in = payload.exp - time.time()
+        if expires_in > 0:
+            access_token_cache.set(cache_key, payload.username, ttl=expires_in)
+
         return payload.username
 
+    def clear_access_token_cache(self) -> None:
+        """
+        Forget every verified token. Call this after rotating SECRET_KEY
+        so tokens signed with the old key are checked again.
+        """
+        access_token_cache.clear()
+
     def create_salt_and_hashed_password(
         self, *, plaintext_password: str
     ) -> UserPasswordUpdate:
@@ -55,6 +177,14 @@ class AuthService:
 
         return UserPasswordUpdate(salt=salt, password=hashed_password)
 
+    async def create_salt_and_hashed_password_async(
+        self, *, plaintext_password: str
+    ) -> UserPasswordUpdate:
+        return await password_hash_pool.run(
+            self.create_salt_and_hashed_password,
+            plaintext_password=plaintext_password,
+        )
+
     def generate_salt(self) -> str:
         return bcrypt.gensalt().decode()
 
@@ -64,6 +194,16 @@ class AuthService:
     def verify_password(self, *, password: str, salt: str, hashed_pw: str) -> bool:
         return pwd_context.verify(password + salt, hashed_pw)
 
+    def password_needs_rehash(self, *, hashed_pw: str) -> bool:
+        return pwd_context.needs_update(hashed_pw)
+
+    async def verify_password_async(
+        self, *, password: str, salt: str, hashed_pw: str
+    ) -> bool:
+        return await password_hash_pool.run(
+            self.verify_password, password=password, salt=salt, hashed_pw=hashed_pw
+        )
+
     def create_access_token_for_user(
         self,
         *,
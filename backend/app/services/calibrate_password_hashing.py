@@ -0,0 +1,82 @@
+"""
+Measure password hashing on this host at a range of costs and recommend
+the PASSWORD_HASH_ROUNDS that keeps a login inside a latency budget.
+
+    python -m app.services.calibrate_password_hashing --target-ms 250
+
+Run it on the same kind of machine the api runs on. Every cost step
+doubles the work for bcrypt, so the highest cost that fits the budget
+is the recommendation.
+"""
+import argparse
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import PASSWORD_HASH_ROUNDS, PASSWORD_HASH_SCHEMES
+from app.services.authentication import AuthService, make_password_context
+
+
+def measure_rounds(*, scheme: str, rounds: int, samples: int) -> Dict[str, float]:
+    context = make_password_context(schemes=[scheme], rounds=rounds)
+    # hash exactly what AuthService hashes: the password plus a salt
+    password = "calibration-password" + AuthService().generate_salt()
+
+    hash_ms, verify_ms = [], []
+    for _ in range(samples):
+        started = time.perf_counter()
+        hashed_pw = context.hash(password)
+        hash_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        context.verify(password, hashed_pw)
+        verify_ms.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "rounds": rounds,
+        "hash_ms": statistics.median(hash_ms),
+        "verify_ms": statistics.median(verify_ms),
+    }
+
+
+def recommend_rounds(
+    measurements: List[Dict[str, float]], *, target_ms: float
+) -> Optional[int]:
+    # a login verifies, so the verify time is what has to fit the budget
+    within_budget = [m["rounds"] for m in measurements if m["verify_ms"] <= target_ms]
+    return max(within_budget) if within_budget else None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--scheme", default=PASSWORD_HASH_SCHEMES[0])
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'rounds':>6} {'hash ms':>10} {'verify ms':>10}")
+    measurements = []
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        measurement = measure_rounds(
+            scheme=args.scheme, rounds=rounds, samples=args.samples
+        )
+        measurements.append(measurement)
+        print(
+            f"{rounds:>6} {measurement['hash_ms']:>10.1f} {measurement['verify_ms']:>10.1f}"
+        )
+
+    recommended = recommend_rounds(measurements, target_ms=args.target_ms)
+    if recommended is None:
+        print(f"No cost from {args.min_rounds} up fits in {args.target_ms:g} ms.")
+        return
+
+    print(
+        f"Recommended PASSWORD_HASH_ROUNDS={recommended} for a {args.target_ms:g} ms "
+        f"budget (currently {PASSWORD_HASH_ROUNDS})."
+    )
+
+
+if __name__ == "__main__":
+    main()
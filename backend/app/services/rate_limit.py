@@ -0,0 +1,108 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from app.core.config import (
+    LOGIN_ATTEMPTS_PER_EMAIL_BURST,
+    LOGIN_ATTEMPTS_PER_EMAIL_PER_MINUTE,
+    LOGIN_ATTEMPTS_PER_IP_BURST,
+    LOGIN_ATTEMPTS_PER_IP_PER_MINUTE,
+)
+from app.core.metrics import register_metrics
+
+
+class RateLimitBackend(ABC):
+    """
+    Where token buckets are stored. The in-memory backend below only
+    limits a single worker; a backend shared by every worker (redis,
+    postgres, ...) implements take() and is handed to the limiters.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, *, capacity: int, refill_per_second: float) -> float:
+        """
+        Take one token from the bucket at key. Returns 0 when a token was
+        available, otherwise the number of seconds until one will be.
+        """
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, *, max_keys: int = 100_000) -> None:
+        # key -> (tokens left, monotonic time they were counted)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.max_keys = max_keys
+
+    async def take(self, key: str, *, capacity: int, refill_per_second: float) -> float:
+        now = time.monotonic()
+        tokens, counted_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - counted_at) * refill_per_second)
+
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / refill_per_second
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        # the least recently seen buckets are the fullest, dropping them
+        # only hands those keys a fresh bucket a little early
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return retry_after
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+class TokenBucketLimiter:
+    """
+    Allows bursts of up to `burst` attempts per key, refilled at
+    `per_minute` attempts a minute.
+    """
+
+    def __init__(
+        self, *, name: str, backend: RateLimitBackend, burst: int, per_minute: float
+    ) -> None:
+        self.name = name
+        self.backend = backend
+        self.burst = burst
+        self.per_minute = per_minute
+        self.rejected = 0
+
+    async def hit(self, key: str) -> float:
+        retry_after = await self.backend.take(
+            f"{self.name}:{key}",
+            capacity=self.burst,
+            refill_per_second=self.per_minute / 60,
+        )
+        if retry_after:
+            self.rejected += 1
+        return retry_after
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "burst": self.burst,
+            "per_minute": self.per_minute,
+            "rejected": self.rejected,
+        }
+
+
+login_rate_limit_backend = InMemoryRateLimitBackend()
+
+login_limiter_by_ip = TokenBucketLimiter(
+    name="login:ip",
+    backend=login_rate_limit_backend,
+    burst=LOGIN_ATTEMPTS_PER_IP_BURST,
+    per_minute=LOGIN_ATTEMPTS_PER_IP_PER_MINUTE,
+)
+login_limiter_by_email = TokenBucketLimiter(
+    name="login:email",
+    backend=login_rate_limit_backend,
+    burst=LOGIN_ATTEMPTS_PER_EMAIL_BURST,
+    per_minute=LOGIN_ATTEMPTS_PER_EMAIL_PER_MINUTE,
+)
+register_metrics("login_limiter_by_ip", login_limiter_by_ip.stats)
+register_metrics("login_limiter_by_email", login_limiter_by_email.stats)
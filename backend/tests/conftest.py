@@ -1,5 +1,6 @@
 import warnings
 import os
+from typing import Dict
 
 import pytest
 from asgi_lifespan import LifespanManager
@@ -7,6 +8,7 @@ from asgi_lifespan import LifespanManager
 from fastapi import FastAPI
 from httpx import AsyncClient
 from databases import Database
+from starlette.datastructures import Secret
 
 import alembic
 from alembic.config import Config
@@ -71,6 +73,15 @@ async def test_cleaning(db: Database) -> CleaningInDB:
     return await cleaning_repo.create_cleaning(new_cleaning=new_cleaning)
 
 
+# headers that let a test read /api/metrics/
+@pytest.fixture
+def metrics_headers(monkeypatch) -> Dict[str, str]:
+    monkeypatch.setattr(
+        "app.api.dependencies.auth.METRICS_TOKEN", Secret("test-metrics-token")
+    )
+    return {"X-Metrics-Token": "test-metrics-token"}
+
+
 @pytest.fixture
 def authorized_client(client: AsyncClient, test_user: UserInDB) -> AsyncClient:
     access_token = auth_service.create_access_token_for_user(
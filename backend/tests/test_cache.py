@@ -0,0 +1,65 @@
+import time
+
+from app.core.cache import LRUCache
+
+
+class TestLRUCache:
+    def test_get_returns_default_and_counts_miss_for_unknown_key(self) -> None:
+        cache = LRUCache(max_size=2, ttl=60)
+        assert cache.get("missing") is None
+        assert cache.get("missing", "default") == "default"
+        assert cache.misses == 2
+        assert cache.hits == 0
+
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # reading "a" makes "b" the least recently used
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.evictions == 1
+        assert len(cache) == 2
+
+    def test_expired_entries_are_not_returned(self, monkeypatch) -> None:
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now)
+        cache = LRUCache(max_size=2, ttl=10)
+        cache.set("short", 1, ttl=1)
+        cache.set("long", 2)
+
+        monkeypatch.setattr(time, "monotonic", lambda: now + 5)
+        assert cache.get("short") is None
+        assert cache.get("long") == 2
+        assert len(cache) == 1
+
+    def test_zero_max_size_disables_cache(self) -> None:
+        cache = LRUCache(max_size=0, ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_delete_and_clear(self) -> None:
+        cache = LRUCache(max_size=3, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.delete("a")
+        cache.delete("not there")
+        assert cache.get("a") is None
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_stats_report_hit_rate(self) -> None:
+        cache = LRUCache(max_size=3, ttl=60)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+        assert stats["size"] == 1
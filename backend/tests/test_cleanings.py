@@ -1,4 +1,5 @@
-from typing import List
+import json
+from typing import Dict, List
 from attr import attrs
 import fastapi
 import pytest
@@ -9,10 +10,15 @@ from fastapi import FastAPI
 from starlette.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_400_BAD_REQUEST,
     HTTP_404_NOT_FOUND,
+    HTTP_413_REQUEST_ENTITY_TOO_LARGE,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
+from app.core.config import CLEANINGS_MAX_PAGE_SIZE
+from app.db.repositories.base import encode_cursor
 from app.models.cleaning import CleaningCreate, CleaningInDB
 
 # decorate all tests with @pytest.mark.asyncio
@@ -53,7 +59,7 @@ class TestingDeleteCleaning:
             (None, 422),
         ),
     )
-    async def test_can_delete_cleaning_successfully(
+    async def test_wrong_id_returns_error(
         self,
         app: FastAPI,
         client: AsyncClient,
@@ -66,6 +72,57 @@ class TestingDeleteCleaning:
         )
         assert res.status_code == status_code
 
+    async def test_can_bulk_delete_cleanings(
+        self, app: FastAPI, client: AsyncClient, new_cleaning: CleaningCreate
+    ) -> None:
+        res = await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={"new_cleanings": [new_cleaning.dict()] * 2},
+        )
+        created_ids = res.json()
+
+        # ids that match nothing are left out of the response
+        res = await client.delete(
+            app.url_path_for("cleanings:bulk-delete-cleanings"),
+            params={"ids": created_ids + [999999]},
+        )
+        assert res.status_code == HTTP_200_OK
+        assert sorted(res.json()) == sorted(created_ids)
+
+        for id in created_ids:
+            res = await client.get(
+                app.url_path_for("cleanings:get-cleaning-by-id", id=id)
+            )
+            assert res.status_code == HTTP_404_NOT_FOUND
+
+    async def test_bulk_delete_requires_ids(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        res = await client.delete(app.url_path_for("cleanings:bulk-delete-cleanings"))
+        assert res.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    @pytest.mark.parametrize("invalid_id", (0, -1, 10 ** 20))
+    async def test_bulk_delete_rejects_ids_outside_the_id_range(
+        self, app: FastAPI, client: AsyncClient, invalid_id: int
+    ) -> None:
+        res = await client.delete(
+            app.url_path_for("cleanings:bulk-delete-cleanings"),
+            params={"ids": [1, invalid_id]},
+        )
+        assert res.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_bulk_delete_rejects_too_many_ids(
+        self, app: FastAPI, client: AsyncClient, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(
+            "app.api.routes.cleanings.CLEANINGS_BULK_DELETE_MAX_SIZE", 2
+        )
+        res = await client.delete(
+            app.url_path_for("cleanings:bulk-delete-cleanings"),
+            params={"ids": [1, 2, 3]},
+        )
+        assert res.status_code == HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
 
 class TestingUpdateCleaning:
     @pytest.mark.parametrize(
@@ -116,6 +173,33 @@ class TestingUpdateCleaning:
             if attr not in attrs_to_change:
                 assert getattr(test_cleaning, attr) == value
 
+    async def test_empty_update_leaves_cleaning_unchanged(
+        self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
+    ) -> None:
+        res = await client.put(
+            app.url_path_for("cleanings:update-cleaning-by-id", id=test_cleaning.id),
+            json={"cleaning_update": {}},
+        )
+        assert res.status_code == HTTP_200_OK
+        assert CleaningInDB(**res.json()) == test_cleaning
+
+    @pytest.mark.parametrize(
+        "payload",
+        ({"name": None}, {"price": None}),
+    )
+    async def test_update_cannot_null_required_columns(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_cleaning: CleaningInDB,
+        payload: dict,
+    ) -> None:
+        res = await client.put(
+            app.url_path_for("cleanings:update-cleaning-by-id", id=test_cleaning.id),
+            json={"cleaning_update": payload},
+        )
+        assert res.status_code == 400
+
     @pytest.mark.parametrize(
         "id, payload, status_code",
         (
@@ -157,6 +241,91 @@ class TestCleaningsRoutes:
         assert res.status_code == HTTP_422_UNPROCESSABLE_ENTITY
 
 
+class TestBulkCreateCleanings:
+    async def test_valid_input_creates_all_cleanings(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        new_cleaning: CleaningCreate,
+        monkeypatch,
+    ) -> None:
+        # force the batch to span more than one INSERT
+        monkeypatch.setattr(
+            "app.db.repositories.cleanings.CLEANINGS_BULK_CHUNK_SIZE", 2
+        )
+        new_cleanings = [
+            new_cleaning.copy(update={"name": f"bulk cleaning {i}"}) for i in range(3)
+        ]
+        res = await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={"new_cleanings": [c.dict() for c in new_cleanings]},
+        )
+        assert res.status_code == HTTP_201_CREATED
+        created_ids = res.json()
+        assert len(created_ids) == 3
+
+        for created_id, sent in zip(created_ids, new_cleanings):
+            res = await client.get(
+                app.url_path_for("cleanings:get-cleaning-by-id", id=created_id)
+            )
+            assert res.status_code == HTTP_200_OK
+            assert CleaningCreate(**res.json()) == sent
+
+    async def test_invalid_item_rejects_whole_batch(
+        self, app: FastAPI, client: AsyncClient, new_cleaning: CleaningCreate
+    ) -> None:
+        res = await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={"new_cleanings": [new_cleaning.dict(), {"name": "no price"}]},
+        )
+        assert res.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    @pytest.mark.parametrize(
+        "invalid_item",
+        ({"cleaning_type": None}, {"price": 10 ** 9}),
+    )
+    async def test_values_postgres_rejects_fail_the_whole_batch(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        new_cleaning: CleaningCreate,
+        invalid_item: dict,
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr(
+            "app.db.repositories.cleanings.CLEANINGS_BULK_CHUNK_SIZE", 1
+        )
+        res = await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={
+                "new_cleanings": [
+                    {**new_cleaning.dict(), "name": "rolled back"},
+                    {**new_cleaning.dict(), **invalid_item},
+                ]
+            },
+        )
+        assert res.status_code == HTTP_400_BAD_REQUEST
+
+        res = await client.get(
+            app.url_path_for("cleanings:search-cleanings"), params={"q": "rolled"}
+        )
+        assert res.json()["cleanings"] == []
+
+    async def test_oversized_batch_is_rejected(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        new_cleaning: CleaningCreate,
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr("app.api.routes.cleanings.CLEANINGS_BULK_MAX_SIZE", 2)
+        res = await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={"new_cleanings": [new_cleaning.dict()] * 3},
+        )
+        assert res.status_code == HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
 class TestGetCleaning:
     async def test_get_all_cleanings_returns_valid_response(
         self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
@@ -171,10 +340,184 @@ class TestGetCleaning:
         that our test_cleaning fixture is present in the response.
         """
 
-        assert isinstance(res.json(), list)
-        assert len(res.json()) > 0
-        cleanings = [CleaningInDB(**l) for l in res.json()]
+        assert isinstance(res.json()["cleanings"], list)
+        assert len(res.json()["cleanings"]) > 0
+        cleanings = [CleaningInDB(**l) for l in res.json()["cleanings"]]
+        assert test_cleaning in cleanings
+
+    async def test_get_all_cleanings_is_paginated_by_cursor(
+        self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
+    ) -> None:
+        # make sure there are at least two pages worth of cleanings
+        await client.post(
+            app.url_path_for("cleanings:create-cleaning"),
+            json={"new_cleaning": {"name": "another cleaning", "price": 1.00}},
+        )
+
+        res = await client.get(
+            app.url_path_for("cleanings:get-all-cleanings"), params={"limit": 1}
+        )
+        assert res.status_code == HTTP_200_OK
+        first_page = res.json()
+        assert len(first_page["cleanings"]) == 1
+        assert first_page["next_cursor"] is not None
+
+        res = await client.get(
+            app.url_path_for("cleanings:get-all-cleanings"),
+            params={"limit": 1, "cursor": first_page["next_cursor"]},
+        )
+        assert res.status_code == HTTP_200_OK
+        second_page = res.json()
+        assert len(second_page["cleanings"]) == 1
+        assert second_page["cleanings"][0]["id"] > first_page["cleanings"][0]["id"]
+
+    async def test_get_all_cleanings_filters_by_type_and_price(
+        self, app: FastAPI, client: AsyncClient, new_cleaning: CleaningCreate
+    ) -> None:
+        await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={
+                "new_cleanings": [
+                    {**new_cleaning.dict(), "cleaning_type": "full_clean", "price": p}
+                    for p in (5.00, 25.00, 50.00)
+                ]
+            },
+        )
+
+        res = await client.get(
+            app.url_path_for("cleanings:get-all-cleanings"),
+            params={"cleaning_type": "full_clean", "min_price": 10, "max_price": 30},
+        )
+        assert res.status_code == HTTP_200_OK
+        cleanings = [CleaningInDB(**l) for l in res.json()["cleanings"]]
+        assert len(cleanings) > 0
+        for cleaning in cleanings:
+            assert cleaning.cleaning_type == "full_clean"
+            assert 10 <= cleaning.price <= 30
+
+    @pytest.mark.parametrize(
+        "sort, sort_attr, descending",
+        (
+            ("price", "price", False),
+            ("-price", "price", True),
+            ("-created_at", "id", True),
+        ),
+    )
+    async def test_get_all_cleanings_sorts_across_pages(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        new_cleaning: CleaningCreate,
+        sort: str,
+        sort_attr: str,
+        descending: bool,
+    ) -> None:
+        await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={
+                "new_cleanings": [
+                    {**new_cleaning.dict(), "price": p} for p in (3.00, 1.00, 2.00)
+                ]
+            },
+        )
+
+        cleanings, cursor = [], None
+        while True:
+            params = {"limit": 2, "sort": sort}
+            if cursor:
+                params["cursor"] = cursor
+            res = await client.get(
+                app.url_path_for("cleanings:get-all-cleanings"), params=params
+            )
+            assert res.status_code == HTTP_200_OK
+            cleanings.extend(CleaningInDB(**l) for l in res.json()["cleanings"])
+            cursor = res.json()["next_cursor"]
+            if not cursor:
+                break
+
+        # every cleaning shows up exactly once, in order
+        assert len({c.id for c in cleanings}) == len(cleanings)
+        keys = [getattr(c, sort_attr) for c in cleanings]
+        assert keys == sorted(keys, reverse=descending)
+
+    async def test_cursor_cannot_be_reused_with_another_sort(
+        self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("cleanings:get-all-cleanings"),
+            params={"limit": 1, "sort": "price"},
+        )
+        res = await client.get(
+            app.url_path_for("cleanings:get-all-cleanings"),
+            params={"sort": "-price", "cursor": res.json()["next_cursor"]},
+        )
+        assert res.status_code == 400
+
+    @pytest.mark.parametrize(
+        "params, status_code",
+        (
+            ({"limit": 0}, 422),
+            ({"limit": CLEANINGS_MAX_PAGE_SIZE + 1}, 422),
+            ({"cursor": "not-a-cursor"}, 400),
+            ({"cursor": "eyJpZCI6ICJhIn0="}, 400),  # {"id": "a"}
+            ({"sort": "name"}, 422),
+            ({"cleaning_type": "invalid cleaning type"}, 422),
+            ({"min_price": -1}, 422),
+        ),
+    )
+    async def test_get_all_cleanings_rejects_invalid_page_params(
+        self, app: FastAPI, client: AsyncClient, params: dict, status_code: int
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("cleanings:get-all-cleanings"), params=params
+        )
+        assert res.status_code == status_code
+
+    @pytest.mark.parametrize(
+        "params",
+        (
+            {"cursor": encode_cursor({"sort": "id", "id": 10 ** 20})},
+            {"cursor": encode_cursor({"sort": "id", "id": 0})},
+            {"cursor": encode_cursor({"sort": "id", "id": True})},
+            {
+                "sort": "price",
+                "cursor": encode_cursor({"sort": "price", "key": "1", "id": -1}),
+            },
+            {
+                "sort": "price",
+                "cursor": encode_cursor({"sort": "price", "key": "Infinity", "id": 1}),
+            },
+            {
+                "sort": "price",
+                "cursor": encode_cursor({"sort": "price", "key": "1e1000", "id": 1}),
+            },
+            {
+                "sort": "price",
+                "cursor": encode_cursor(
+                    {"sort": "price", "key": "-1e-100000", "id": 1}
+                ),
+            },
+        ),
+    )
+    async def test_get_all_cleanings_rejects_forged_cursors(
+        self, app: FastAPI, client: AsyncClient, params: dict
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("cleanings:get-all-cleanings"), params=params
+        )
+        assert res.status_code == HTTP_400_BAD_REQUEST
+        assert res.json()["detail"] == "Invalid pagination cursor."
+
+    async def test_export_streams_every_cleaning_as_ndjson(
+        self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
+    ) -> None:
+        res = await client.get(app.url_path_for("cleanings:export-cleanings"))
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["content-type"].startswith("application/x-ndjson")
+
+        cleanings = [CleaningInDB(**json.loads(l)) for l in res.text.splitlines()]
         assert test_cleaning in cleanings
+        assert [c.id for c in cleanings] == sorted(c.id for c in cleanings)
 
     async def test_get_cleaning_by_id(
         self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
@@ -207,6 +550,168 @@ class TestGetCleaning:
         assert res.status_code == status_code
 
 
+class TestSearchCleanings:
+    async def test_search_ranks_name_matches_first(
+        self, app: FastAPI, client: AsyncClient, new_cleaning: CleaningCreate
+    ) -> None:
+        res = await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={
+                "new_cleanings": [
+                    {**new_cleaning.dict(), "description": "mentions the zanzibar"},
+                    {**new_cleaning.dict(), "name": "zanzibar deep clean"},
+                    {**new_cleaning.dict(), "name": "unrelated"},
+                ]
+            },
+        )
+        description_match, name_match, _ = res.json()
+
+        res = await client.get(
+            app.url_path_for("cleanings:search-cleanings"), params={"q": "zanzibar"}
+        )
+        assert res.status_code == HTTP_200_OK
+        found = [c["id"] for c in res.json()["cleanings"]]
+        assert found == [name_match, description_match]
+
+    async def test_search_is_paginated(
+        self, app: FastAPI, client: AsyncClient, new_cleaning: CleaningCreate
+    ) -> None:
+        res = await client.post(
+            app.url_path_for("cleanings:bulk-create-cleanings"),
+            json={"new_cleanings": [{**new_cleaning.dict(), "name": "tasmania"}] * 3},
+        )
+        created_ids = res.json()
+
+        found, cursor = [], None
+        while True:
+            params = {"q": "tasmania", "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            res = await client.get(
+                app.url_path_for("cleanings:search-cleanings"), params=params
+            )
+            assert res.status_code == HTTP_200_OK
+            found.extend(c["id"] for c in res.json()["cleanings"])
+            cursor = res.json()["next_cursor"]
+            if not cursor:
+                break
+
+        assert sorted(found) == sorted(created_ids)
+
+    @pytest.mark.parametrize(
+        "params, status_code",
+        (
+            ({}, 422),
+            ({"q": ""}, 422),
+            ({"q": "clean", "cursor": "not-a-cursor"}, 400),
+            (
+                {"q": "clean", "cursor": encode_cursor({"rank": 0.1, "id": 10 ** 20})},
+                400,
+            ),
+            ({"q": "clean", "cursor": encode_cursor({"rank": 0.1, "id": 0})}, 400),
+            ({"q": "clean", "cursor": encode_cursor({"rank": 1e308, "id": 1})}, 400),
+            ({"q": "clean", "cursor": encode_cursor({"rank": -1.0, "id": 1})}, 400),
+            (
+                {
+                    "q": "clean",
+                    "cursor": encode_cursor({"rank": float("nan"), "id": 1}),
+                },
+                400,
+            ),
+        ),
+    )
+    async def test_invalid_search_params_raise_error(
+        self, app: FastAPI, client: AsyncClient, params: dict, status_code: int
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("cleanings:search-cleanings"), params=params
+        )
+        assert res.status_code == status_code
+
+
+class TestCleaningsCache:
+    async def test_repeated_reads_are_served_from_cache(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_cleaning: CleaningInDB,
+        metrics_headers: Dict[str, str],
+    ) -> None:
+        url = app.url_path_for("cleanings:get-cleaning-by-id", id=test_cleaning.id)
+        await client.get(url)
+
+        res = await client.get(
+            app.url_path_for("metrics:get-metrics"), headers=metrics_headers
+        )
+        hits = res.json()["cleanings_cache"]["hits"]
+
+        res = await client.get(url)
+        assert res.status_code == HTTP_200_OK
+        assert CleaningInDB(**res.json()) == test_cleaning
+
+        res = await client.get(
+            app.url_path_for("metrics:get-metrics"), headers=metrics_headers
+        )
+        assert res.json()["cleanings_cache"]["hits"] == hits + 1
+
+    async def test_update_invalidates_cached_cleaning(
+        self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
+    ) -> None:
+        url = app.url_path_for("cleanings:get-cleaning-by-id", id=test_cleaning.id)
+        await client.get(url)
+
+        await client.put(
+            app.url_path_for("cleanings:update-cleaning-by-id", id=test_cleaning.id),
+            json={"cleaning_update": {"name": "freshly renamed"}},
+        )
+        res = await client.get(url)
+        assert res.json()["name"] == "freshly renamed"
+
+    async def test_bulk_delete_invalidates_cached_cleanings(
+        self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
+    ) -> None:
+        url = app.url_path_for("cleanings:get-cleaning-by-id", id=test_cleaning.id)
+        await client.get(url)
+
+        await client.delete(
+            app.url_path_for("cleanings:bulk-delete-cleanings"),
+            params={"ids": [test_cleaning.id]},
+        )
+        res = await client.get(url)
+        assert res.status_code == HTTP_404_NOT_FOUND
+
+
+class TestCleaningETags:
+    async def test_unchanged_cleaning_returns_not_modified(
+        self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
+    ) -> None:
+        url = app.url_path_for("cleanings:get-cleaning-by-id", id=test_cleaning.id)
+        res = await client.get(url)
+        assert res.status_code == HTTP_200_OK
+        etag = res.headers["etag"]
+
+        res = await client.get(url, headers={"If-None-Match": etag})
+        assert res.status_code == HTTP_304_NOT_MODIFIED
+        assert res.headers["etag"] == etag
+        assert res.content == b""
+
+    async def test_updated_cleaning_gets_new_etag(
+        self, app: FastAPI, client: AsyncClient, test_cleaning: CleaningInDB
+    ) -> None:
+        url = app.url_path_for("cleanings:get-cleaning-by-id", id=test_cleaning.id)
+        res = await client.get(url)
+        etag = res.headers["etag"]
+
+        await client.put(
+            app.url_path_for("cleanings:update-cleaning-by-id", id=test_cleaning.id),
+            json={"cleaning_update": {"price": 19.99}},
+        )
+        res = await client.get(url, headers={"If-None-Match": etag})
+        assert res.status_code == HTTP_200_OK
+        assert res.headers["etag"] != etag
+        assert res.json()["price"] == 19.99
+
+
 class TestCreateCleaning:
     async def test_valid_input_creates_cleaning(
         self, app: FastAPI, client: AsyncClient, new_cleaning: CleaningCreate
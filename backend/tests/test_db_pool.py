@@ -0,0 +1,60 @@
+from typing import Dict
+
+import pytest
+from databases import Database
+from fastapi import FastAPI, HTTPException, status
+from httpx import AsyncClient
+
+from app.core.metrics import Histogram
+from app.db.pool import instrument_pool
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestHistogram:
+    def test_buckets_are_cumulative(self) -> None:
+        histogram = Histogram(buckets=(10, 1, 100))
+        for value in (0.5, 5, 50, 500):
+            histogram.observe(value)
+
+        stats = histogram.stats()
+        assert stats["count"] == 4
+        assert stats["sum"] == 555.5
+        assert stats["buckets"] == {"1": 1, "10": 2, "100": 3, "+Inf": 4}
+
+
+class TestInstrumentedPool:
+    async def test_pool_stats_are_exposed_as_metrics(
+        self, app: FastAPI, client: AsyncClient, metrics_headers: Dict[str, str]
+    ) -> None:
+        # any request that touches the database checks out a connection
+        await client.get(app.url_path_for("cleanings:get-all-cleanings"))
+
+        res = await client.get(
+            app.url_path_for("metrics:get-metrics"), headers=metrics_headers
+        )
+        assert res.status_code == status.HTTP_200_OK
+        pool_stats = res.json()["db_pool"]
+        assert pool_stats["size"] >= pool_stats["min_size"]
+        assert pool_stats["in_use"] + pool_stats["idle"] == pool_stats["size"]
+        assert pool_stats["waiters"] == 0
+        assert pool_stats["acquire_ms"]["count"] >= 1
+
+    async def test_acquire_timeout_returns_service_unavailable(
+        self, app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        database = Database(db.url, min_size=1, max_size=1)
+        await database.connect()
+        pool = instrument_pool(database, acquire_timeout=0.05)
+        try:
+            connection = await pool.acquire()
+            with pytest.raises(HTTPException) as exc_info:
+                await pool.acquire()
+            assert exc_info.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert pool.stats()["acquire_timeouts"] == 1
+            assert pool.stats()["in_use"] == 1
+
+            await pool.release(connection)
+            assert pool.stats()["waiters"] == 0
+        finally:
+            await database.disconnect()
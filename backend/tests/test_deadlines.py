@@ -0,0 +1,250 @@
+import asyncio
+import time
+from typing import Dict
+
+import asyncpg
+import pytest
+from databases import Database
+from fastapi import BackgroundTasks, Depends, FastAPI, status
+from httpx import AsyncClient
+
+from app.api.dependencies.database import get_unit_of_work
+from app.api.middleware import (
+    DeadlineMiddleware,
+    deadline_stats,
+    parse_deadline_overrides,
+)
+from app.core import config
+from app.db import instrumentation
+from app.db.unit_of_work import UnitOfWork
+from app.models.cleaning import CleaningInDB
+
+pytestmark = pytest.mark.asyncio
+
+# filled by the background task of the deadlines:background route
+background_done: list = []
+
+
+@pytest.fixture
+def app(apply_migrations: None, monkeypatch: pytest.MonkeyPatch) -> FastAPI:
+    """
+    The app with a few routes that take too long, and short budgets for them
+    """
+    monkeypatch.setattr(
+        config,
+        "REQUEST_DEADLINE_OVERRIDES",
+        ["deadlines:sleep=0.2", "deadlines:sleep-in-unit-of-work=0.2"],
+    )
+    from app.api.server import get_application
+
+    app = get_application()
+
+    @app.get("/deadlines/sleep/", name="deadlines:sleep")
+    async def sleep() -> dict:
+        await asyncio.sleep(5)
+        return {}
+
+    @app.get(
+        "/deadlines/sleep-in-unit-of-work/", name="deadlines:sleep-in-unit-of-work"
+    )
+    async def sleep_in_unit_of_work(
+        unit_of_work: UnitOfWork = Depends(get_unit_of_work),
+    ) -> dict:
+        await unit_of_work.db.execute("SELECT pg_sleep(5)")
+        return {}
+
+    @app.post("/deadlines/statement-timeout/", name="deadlines:statement-timeout")
+    async def statement_timeout(
+        unit_of_work: UnitOfWork = Depends(get_unit_of_work),
+    ) -> dict:
+        record = await unit_of_work.db.fetch_one("SHOW statement_timeout")
+        return {"statement_timeout": record["statement_timeout"]}
+
+    @app.post("/deadlines/cancelled-query/", name="deadlines:cancelled-query")
+    async def cancelled_query(
+        unit_of_work: UnitOfWork = Depends(get_unit_of_work),
+    ) -> dict:
+        await unit_of_work.db.execute("SET LOCAL statement_timeout = 50")
+        await unit_of_work.db.execute("SELECT pg_sleep(1)")
+        return {}
+
+    @app.get("/deadlines/background/", name="deadlines:background")
+    async def background(background_tasks: BackgroundTasks) -> dict:
+        async def finish() -> None:
+            await asyncio.sleep(0.05)
+            background_done.append(True)
+
+        background_tasks.add_task(finish)
+        return {}
+
+    background_done.clear()
+    return app
+
+
+class TestDeadlineOverrides:
+    def test_overrides_are_parsed_per_route_name(self) -> None:
+        assert parse_deadline_overrides(
+            ["cleanings:export-cleanings=300", " profiles:get-profiles-batch = 2.5"]
+        ) == {"cleanings:export-cleanings": 300, "profiles:get-profiles-batch": 2.5}
+
+
+class TestDeadlines:
+    async def test_blown_deadline_returns_gateway_timeout_quickly(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        started = time.monotonic()
+        res = await client.get(app.url_path_for("deadlines:sleep"))
+        assert res.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+        assert time.monotonic() - started < 2
+
+    async def test_cancelled_request_returns_its_connection(
+        self, app: FastAPI, client: AsyncClient, metrics_headers: Dict[str, str]
+    ) -> None:
+        res = await client.get(app.url_path_for("deadlines:sleep-in-unit-of-work"))
+        assert res.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+
+        # a connection cancelled mid query goes back to the pool once
+        # postgres has confirmed the cancel, which can take a moment
+        for _ in range(20):
+            res = await client.get(
+                app.url_path_for("metrics:get-metrics"), headers=metrics_headers
+            )
+            if res.json()["db_pool"]["in_use"] == 0:
+                break
+            await asyncio.sleep(0.05)
+        assert res.json()["db_pool"]["in_use"] == 0
+        assert res.json()["deadlines"]["deadline_exceeded"] >= 1
+
+    async def test_statement_timeout_is_what_is_left_of_the_budget(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        res = await client.post(app.url_path_for("deadlines:statement-timeout"))
+        assert res.status_code == status.HTTP_200_OK
+        statement_timeout = res.json()["statement_timeout"]
+        if statement_timeout.endswith("ms"):
+            timeout_ms = int(statement_timeout[:-2])
+        else:
+            timeout_ms = int(statement_timeout[:-1]) * 1000
+        assert 0 < timeout_ms <= config.REQUEST_DEADLINE_SECONDS * 1000
+
+    async def test_statement_timeout_is_not_timed_as_a_query(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        name = "test_deadlines.statement_timeout"
+        histogram = instrumentation.query_latency.get(name)
+        before = histogram.stats()["count"] if histogram else 0
+
+        res = await client.post(app.url_path_for("deadlines:statement-timeout"))
+        assert res.status_code == status.HTTP_200_OK
+        # only the SHOW, not the SET issued as the unit of work began
+        assert instrumentation.query_latency[name].stats()["count"] == before + 1
+
+    async def test_statement_timeout_returns_gateway_timeout(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        res = await client.post(app.url_path_for("deadlines:cancelled-query"))
+        assert res.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+
+    async def test_update_timing_out_returns_gateway_timeout(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        test_cleaning: CleaningInDB,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(
+            "app.api.dependencies.database.remaining_budget_ms", lambda request: 100
+        )
+
+        # another transaction holds the row, so the update waits for it
+        # until the statement timeout cancels it
+        locker = await asyncpg.connect(str(db.url))
+        try:
+            async with locker.transaction():
+                await locker.execute(
+                    "SELECT id FROM cleanings WHERE id = $1 FOR UPDATE",
+                    test_cleaning.id,
+                )
+                res = await client.put(
+                    app.url_path_for(
+                        "cleanings:update-cleaning-by-id", id=test_cleaning.id
+                    ),
+                    json={"cleaning_update": {"price": 1}},
+                )
+        finally:
+            await locker.close()
+
+        assert res.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+
+    async def test_request_is_cancelled_when_the_client_disconnects(
+        self, app: FastAPI
+    ) -> None:
+        cancelled = asyncio.Event()
+
+        async def slow_app(scope, receive, send) -> None:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def receive() -> dict:
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            raise AssertionError("nothing should be sent to a gone client")
+
+        middleware = DeadlineMiddleware(slow_app, default_seconds=10, overrides=[])
+        scope = {
+            "type": "http",
+            "app": app,
+            "method": "GET",
+            "path": "/gone/",
+            "root_path": "",
+            "headers": [],
+        }
+        await asyncio.wait_for(middleware(scope, receive, send), timeout=2)
+        assert cancelled.is_set()
+
+    async def test_background_tasks_outlive_the_response(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        disconnected = deadline_stats["client_disconnected"]
+
+        # the server reports a disconnect as soon as the response is sent
+        res = await client.get(app.url_path_for("deadlines:background"))
+        assert res.status_code == status.HTTP_200_OK
+        assert background_done == [True]
+        assert deadline_stats["client_disconnected"] == disconnected
+
+    async def test_request_body_is_not_read_ahead_of_the_app(
+        self, app: FastAPI
+    ) -> None:
+        received = 0
+
+        async def idle_app(scope, receive, send) -> None:
+            await asyncio.sleep(0.1)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def receive() -> dict:
+            nonlocal received
+            received += 1
+            await asyncio.sleep(0)
+            return {"type": "http.request", "body": b"x" * 1024, "more_body": True}
+
+        async def send(message: dict) -> None:
+            pass
+
+        middleware = DeadlineMiddleware(idle_app, default_seconds=10, overrides=[])
+        scope = {
+            "type": "http",
+            "app": app,
+            "method": "POST",
+            "path": "/upload/",
+            "root_path": "",
+            "headers": [],
+        }
+        await asyncio.wait_for(middleware(scope, receive, send), timeout=2)
+        assert received <= 3
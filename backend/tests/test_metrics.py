@@ -0,0 +1,34 @@
+from typing import Dict
+
+import pytest
+from fastapi import FastAPI, status
+from httpx import AsyncClient
+from starlette.datastructures import Secret
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestMetricsAccess:
+    async def test_metrics_require_the_token(
+        self, app: FastAPI, client: AsyncClient, metrics_headers: Dict[str, str]
+    ) -> None:
+        url = app.url_path_for("metrics:get-metrics")
+
+        res = await client.get(url)
+        assert res.status_code == status.HTTP_403_FORBIDDEN
+
+        res = await client.get(url, headers={"X-Metrics-Token": "wrong"})
+        assert res.status_code == status.HTTP_403_FORBIDDEN
+
+        res = await client.get(url, headers=metrics_headers)
+        assert res.status_code == status.HTTP_200_OK
+        assert "cleanings_cache" in res.json()
+
+    async def test_metrics_are_closed_without_a_configured_token(
+        self, app: FastAPI, client: AsyncClient, monkeypatch
+    ) -> None:
+        monkeypatch.setattr("app.api.dependencies.auth.METRICS_TOKEN", Secret(""))
+        res = await client.get(
+            app.url_path_for("metrics:get-metrics"), headers={"X-Metrics-Token": ""}
+        )
+        assert res.status_code == status.HTTP_403_FORBIDDEN
@@ -5,11 +5,11 @@ import pytest
 from databases import Database
 from fastapi import FastAPI, status
 from httpx import AsyncClient
-from websockets import client
 
 from app.db.repositories.profiles import ProfilesRepository
-from app.models.profile import ProfileInDB, ProfilePublic
-from app.models.user import UserInDB, UserPublic
+from app.db.repositories.users import UsersRepository
+from app.models.profile import ProfileBatch, ProfileInDB, ProfilePublic, ProfileUpdate
+from app.models.user import UserCreate, UserInDB, UserPublic
 
 pytestmark = pytest.mark.asyncio
 
@@ -41,6 +41,64 @@ class TestProfileManagement:
         profile = ProfilePublic(**res.json())
         assert getattr(profile, attr) == value
 
+    async def test_profile_update_is_visible_to_cached_user(
+        self, app: FastAPI, authorized_client: AsyncClient, test_user: UserInDB
+    ) -> None:
+        # prime the authenticated user cache
+        await authorized_client.get(app.url_path_for("users:get-current-user"))
+
+        res = await authorized_client.put(
+            app.url_path_for("profiles:update-own-profile"),
+            json={"profile_update": {"bio": "freshly cached bio"}},
+        )
+        assert res.status_code == status.HTTP_200_OK
+
+        res = await authorized_client.get(app.url_path_for("users:get-current-user"))
+        assert UserPublic(**res.json()).profile.bio == "freshly cached bio"
+
+    async def test_update_only_changes_supplied_fields(
+        self, app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        user_repo = UsersRepository(db)
+        profiles_repo = ProfilesRepository(db)
+        user = await user_repo.register_new_user(
+            new_user=UserCreate(
+                email="partial@update.io",
+                username="partialupdate",
+                password="partialpass",
+            )
+        )
+        await profiles_repo.update_profile(
+            profile_update=ProfileUpdate(full_name="Partial Update"),
+            requesting_user=user,
+        )
+        profile = await profiles_repo.update_profile(
+            profile_update=ProfileUpdate(bio="only the bio"), requesting_user=user
+        )
+        assert profile.full_name == "Partial Update"
+        assert profile.bio == "only the bio"
+
+    async def test_update_creates_profile_for_user_without_one(
+        self, app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        user_repo = UsersRepository(db)
+        profiles_repo = ProfilesRepository(db)
+        user = await user_repo.register_new_user(
+            new_user=UserCreate(
+                email="no@profile.io", username="noprofile", password="noprofilepass"
+            )
+        )
+        await db.execute(
+            "DELETE FROM profiles WHERE user_id = :user_id", {"user_id": user.id}
+        )
+
+        profile = await profiles_repo.update_profile(
+            profile_update=ProfileUpdate(bio="brand new"), requesting_user=user
+        )
+        assert profile.user_id == user.id
+        assert profile.bio == "brand new"
+        assert await profiles_repo.get_profile_by_user_id(user_id=user.id) == profile
+
     @pytest.mark.parametrize(
         "attr, value, status_code",
         (
@@ -83,6 +141,26 @@ class TestProfileView:
         profile = ProfilePublic(**res.json())
         assert profile.username == test_user2.username
 
+    async def test_unchanged_profile_returns_not_modified(
+        self,
+        app: FastAPI,
+        authorized_client: AsyncClient,
+        test_user2: UserInDB,
+    ) -> None:
+        url = app.url_path_for(
+            "profiles:get-profile-by-username", username=test_user2.username
+        )
+        res = await authorized_client.get(url)
+        assert res.status_code == status.HTTP_200_OK
+        etag = res.headers["etag"]
+
+        res = await authorized_client.get(url, headers={"If-None-Match": etag})
+        assert res.status_code == status.HTTP_304_NOT_MODIFIED
+        assert res.headers["etag"] == etag
+
+        res = await authorized_client.get(url, headers={"If-None-Match": '"stale"'})
+        assert res.status_code == status.HTTP_200_OK
+
     async def test_unregistered_users_cannot_access_other_users_profile(
         self, app: FastAPI, client: AsyncClient, test_user2: UserInDB
     ) -> None:
@@ -104,6 +182,77 @@ class TestProfileView:
         assert res.status_code == status.HTTP_404_NOT_FOUND
 
 
+class TestProfileBatch:
+    async def test_batch_by_usernames_keeps_request_order_and_reports_missing(
+        self,
+        app: FastAPI,
+        authorized_client: AsyncClient,
+        test_user: UserInDB,
+        test_user2: UserInDB,
+    ) -> None:
+        usernames = [test_user2.username, "nobody_by_that_name", test_user.username]
+        res = await authorized_client.get(
+            app.url_path_for("profiles:get-profiles-batch"),
+            params={"usernames": ",".join(usernames)},
+        )
+        assert res.status_code == status.HTTP_200_OK
+        batch = ProfileBatch(**res.json())
+        assert [p.username for p in batch.profiles] == [
+            test_user2.username,
+            test_user.username,
+        ]
+        assert batch.missing_usernames == ["nobody_by_that_name"]
+        assert batch.missing_user_ids == []
+
+    async def test_batch_by_user_ids(
+        self,
+        app: FastAPI,
+        authorized_client: AsyncClient,
+        test_user: UserInDB,
+        test_user2: UserInDB,
+    ) -> None:
+        res = await authorized_client.get(
+            app.url_path_for("profiles:get-profiles-batch"),
+            params={
+                "user_ids": f"{test_user2.id},999999,{test_user.id},{test_user2.id}"
+            },
+        )
+        assert res.status_code == status.HTTP_200_OK
+        batch = ProfileBatch(**res.json())
+        assert [p.user_id for p in batch.profiles] == [test_user2.id, test_user.id]
+        assert batch.missing_user_ids == [999999]
+
+    @pytest.mark.parametrize(
+        "params, status_code",
+        (
+            ({}, 422),
+            ({"usernames": "a", "user_ids": "1"}, 422),
+            ({"user_ids": "1,two"}, 422),
+            ({"usernames": ",".join(f"user{i}" for i in range(101))}, 413),
+        ),
+    )
+    async def test_invalid_batch_params_raise_error(
+        self,
+        app: FastAPI,
+        authorized_client: AsyncClient,
+        params: dict,
+        status_code: int,
+    ) -> None:
+        res = await authorized_client.get(
+            app.url_path_for("profiles:get-profiles-batch"), params=params
+        )
+        assert res.status_code == status_code
+
+    async def test_unregistered_users_cannot_batch_lookup_profiles(
+        self, app: FastAPI, client: AsyncClient, test_user: UserInDB
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("profiles:get-profiles-batch"),
+            params={"usernames": test_user.username},
+        )
+        assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+
 class TestProfileCreate:
     async def test_profile_created_for_new_users(
         self, app: FastAPI, client: AsyncClient, db: Database
@@ -0,0 +1,127 @@
+import logging
+from typing import Dict
+
+import asyncpg
+import pytest
+from databases import Database
+from fastapi import FastAPI, status
+from httpx import AsyncClient
+
+from app.db import instrumentation
+from app.db.repositories.users import UsersRepository
+from app.models.cleaning import CleaningInDB
+from app.models.user import UserInDB
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestQueryLatency:
+    async def test_query_latency_is_exposed_per_repository_query(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_cleaning: CleaningInDB,
+        metrics_headers: Dict[str, str],
+    ) -> None:
+        res = await client.get(app.url_path_for("cleanings:get-all-cleanings"))
+        assert res.status_code == status.HTTP_200_OK
+
+        res = await client.get(
+            app.url_path_for("metrics:get-metrics"), headers=metrics_headers
+        )
+        queries = res.json()["queries"]
+        # templated, so named after the method
+        assert queries["cleanings.get_all_cleanings"]["count"] >= 1
+        assert queries["cleanings.CREATE_CLEANING_QUERY"]["count"] >= 1
+
+    async def test_queries_run_by_one_method_are_timed_apart(
+        self, app: FastAPI, client: AsyncClient, db: Database, test_user: UserInDB
+    ) -> None:
+        user_repo = UsersRepository(db, use_cache=False)
+        await user_repo.get_user_by_email(email=test_user.email, populate=False)
+        await user_repo.get_user_by_email(email=test_user.email)
+
+        assert "users.get_user_by_email" not in instrumentation.query_latency
+        for name in (
+            "users.GET_USER_BY_EMAIL_QUERY",
+            "users.GET_USER_WITH_PROFILE_BY_EMAIL_QUERY",
+        ):
+            assert instrumentation.query_latency[name].stats()["count"] >= 1
+
+    async def test_export_stream_is_timed(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_cleaning: CleaningInDB,
+        metrics_headers: Dict[str, str],
+    ) -> None:
+        res = await client.get(app.url_path_for("cleanings:export-cleanings"))
+        assert res.status_code == status.HTTP_200_OK
+
+        res = await client.get(
+            app.url_path_for("metrics:get-metrics"), headers=metrics_headers
+        )
+        queries = res.json()["queries"]
+        assert queries["cleanings.EXPORT_CLEANINGS_QUERY"]["count"] >= 1
+
+    async def test_slow_queries_are_logged_without_their_values(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        caplog: pytest.LogCaptureFixture,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 0)
+        monkeypatch.setattr(instrumentation, "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1)
+
+        with caplog.at_level(logging.WARNING, logger="app.db.instrumentation"):
+            await db.fetch_one(
+                "SELECT CAST(:secret AS text) AS x", {"secret": "hunter2"}
+            )
+            # explained in the background, after the query has returned
+            await db._explain_task
+
+        assert "hunter2" not in caplog.text
+        assert "Slow query test_query_instrumentation.test_slow_queries" in caplog.text
+        assert "params={'secret': 'str'}" in caplog.text
+        assert "Plan for slow query" in caplog.text
+
+    async def test_slow_writes_are_not_explained(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        caplog: pytest.LogCaptureFixture,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 0)
+        monkeypatch.setattr(instrumentation, "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1)
+
+        with caplog.at_level(logging.WARNING, logger="app.db.instrumentation"):
+            await db.execute(
+                "UPDATE cleanings SET price = price WHERE id = :id", {"id": 0}
+            )
+
+        assert "Slow query" in caplog.text
+        assert "Plan for slow query" not in caplog.text
+
+    async def test_failed_queries_are_timed_but_not_logged(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        caplog: pytest.LogCaptureFixture,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 0)
+        monkeypatch.setattr(instrumentation, "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1)
+        name = "test_query_instrumentation.test_failed_queries_are_timed_but_not_logged"
+
+        with caplog.at_level(logging.WARNING, logger="app.db.instrumentation"):
+            with pytest.raises(asyncpg.DivisionByZeroError):
+                await db.fetch_one("SELECT 1 / 0 AS x")
+
+        assert "Slow query" not in caplog.text
+        assert db._explain_task is None or db._explain_task.done()
+        assert instrumentation.query_latency[name].stats()["count"] == 1
@@ -0,0 +1,228 @@
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+from databases import Database
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from app.db.warm_up import repository_queries
+
+pytestmark = pytest.mark.asyncio
+
+
+# Tables that grow with usage. A sequential scan on any of them is fine
+# with a handful of test rows but turns into a full table read per
+# request in production.
+LARGE_TABLES = {"cleanings", "users", "profiles"}
+
+# queries that are meant to read the whole table
+FULL_SCAN_QUERIES = {"cleanings.EXPORT_CLEANINGS_QUERY"}
+
+SEED_CLEANINGS = 20000
+SEED_USERS = 5000
+
+# Enough rows, spread like real data, that the planner prefers an index
+# wherever one applies. Roughly one cleaning in a hundred mentions a
+# carpet so the search has something selective to look for.
+SEED_QUERIES = (
+    f"""
+    INSERT INTO cleanings (name, description, price, cleaning_type)
+    SELECT 'seeded cleaning ' || i,
+           CASE WHEN i % 100 = 0 THEN 'deep carpet shampoo' ELSE 'tidy kitchen and floors ' || i END,
+           (i * 7919 % 100000) / 100.0,
+           (ARRAY['dust_up', 'spot_clean', 'full_clean'])[i % 3 + 1]
+    FROM generate_series(1, {SEED_CLEANINGS}) AS i;
+    """,
+    f"""
+    INSERT INTO users (username, email, salt, password)
+    SELECT 'seeded_user_' || i, 'seeded_user_' || i || '@phresh.io', 'salt', 'password'
+    FROM generate_series(1, {SEED_USERS}) AS i;
+    """,
+    """
+    INSERT INTO profiles (user_id)
+    SELECT id FROM users WHERE username LIKE 'seeded_user_%';
+    """,
+    # new GIN entries wait in a pending list until autovacuum merges
+    # them, which makes a freshly seeded index look far too expensive
+    "SELECT gin_clean_pending_list('ix_cleanings_search_vector');",
+    "ANALYZE cleanings;",
+    "ANALYZE users;",
+    "ANALYZE profiles;",
+)
+
+# "<module>.<constant>" -> list of (template kwargs, bind values), one
+# entry per shape the repository actually sends
+QUERY_CASES: Dict[str, List[Tuple[Dict[str, str], Dict[str, Any]]]] = {
+    "cleanings.CREATE_CLEANING_QUERY": [
+        (
+            {},
+            {
+                "name": "new",
+                "description": "new",
+                "price": 9.99,
+                "cleaning_type": "spot_clean",
+            },
+        )
+    ],
+    "cleanings.BULK_CREATE_CLEANINGS_QUERY": [
+        (
+            {},
+            {
+                "names": ["a", "b"],
+                "descriptions": ["a", "b"],
+                "prices": [1, 2],
+                "cleaning_types": ["spot_clean", "dust_up"],
+            },
+        )
+    ],
+    "cleanings.GET_CLEANING_BY_ID_QUERY": [({}, {"id": 1})],
+    "cleanings.GET_ALL_CLEANINGS_QUERY": [
+        (
+            {"sort_column": "id", "conditions": "TRUE", "order_by": "id ASC"},
+            {"limit": 51},
+        ),
+        (
+            {
+                "sort_column": "id",
+                "conditions": "TRUE AND id > :after_id",
+                "order_by": "id ASC",
+            },
+            {"limit": 51, "after_id": 10000},
+        ),
+        (
+            {
+                "sort_column": "price",
+                "conditions": "TRUE AND (price, id) < (:after_key, :after_id)",
+                "order_by": "price DESC, id DESC",
+            },
+            {"limit": 51, "after_key": 500, "after_id": 10000},
+        ),
+        (
+            {
+                "sort_column": "created_at",
+                "conditions": "TRUE AND cleaning_type = :cleaning_type",
+                "order_by": "created_at DESC, id DESC",
+            },
+            {"limit": 51, "cleaning_type": "spot_clean"},
+        ),
+        (
+            {
+                "sort_column": "price",
+                "conditions": "TRUE AND cleaning_type = :cleaning_type "
+                "AND price >= :min_price AND price <= :max_price",
+                "order_by": "price ASC, id ASC",
+            },
+            {
+                "limit": 51,
+                "cleaning_type": "full_clean",
+                "min_price": 100,
+                "max_price": 200,
+            },
+        ),
+    ],
+    "cleanings.SEARCH_CLEANINGS_QUERY": [
+        ({"after": "TRUE"}, {"q": "carpet", "limit": 51}),
+        (
+            {"after": "(rank, id) < (:after_rank, :after_id)"},
+            {"q": "carpet", "limit": 51, "after_rank": 0.5, "after_id": 10000},
+        ),
+    ],
+    "cleanings.EXPORT_CLEANINGS_QUERY": [({}, {})],
+    "cleanings.UPDATE_CLEANING_BY_ID_QUERY": [
+        ({"set_columns": "price = :price"}, {"price": 10, "id": 1})
+    ],
+    "cleanings.DELETE_CLEANING_BY_ID_QUERY": [({}, {"id": 1})],
+    "cleanings.BULK_DELETE_CLEANINGS_QUERY": [({}, {"ids": [1, 2, 3]})],
+    "profiles.CREATE_PROFILE_FOR_USER_QUERY": [
+        (
+            {},
+            {
+                "full_name": None,
+                "phone_number": None,
+                "bio": None,
+                "image": None,
+                "user_id": 1,
+            },
+        )
+    ],
+    "profiles.GET_PROFILE_BY_USER_ID_QUERY": [({}, {"user_id": 1})],
+    "profiles.GET_PROFILE_BY_USERNAME_QUERY": [({}, {"username": "seeded_user_1"})],
+    "profiles.GET_PROFILES_BY_USERNAMES_QUERY": [
+        ({}, {"usernames": ["seeded_user_1", "seeded_user_2"]})
+    ],
+    "profiles.GET_PROFILES_BY_USER_IDS_QUERY": [({}, {"user_ids": [1, 2]})],
+    "profiles.UPDATE_PROFILE_QUERY": [
+        ({"set_columns": "bio = :bio"}, {"bio": "new bio", "user_id": 1})
+    ],
+    "users.CHECK_USER_CREDENTIALS_TAKEN_QUERY": [
+        ({}, {"email": "seeded_user_1@phresh.io", "username": "seeded_user_1"})
+    ],
+    "users.GET_USER_BY_EMAIL_QUERY": [({}, {"email": "seeded_user_1@phresh.io"})],
+    "users.GET_USER_BY_USERNAME_QUERY": [({}, {"username": "seeded_user_1"})],
+    "users.GET_USER_BY_ID_QUERY": [({}, {"id": 1})],
+    "users.GET_USER_WITH_PROFILE_BY_EMAIL_QUERY": [
+        ({}, {"email": "seeded_user_1@phresh.io"})
+    ],
+    "users.GET_USER_WITH_PROFILE_BY_USERNAME_QUERY": [
+        ({}, {"username": "seeded_user_1"})
+    ],
+    "users.GET_USER_WITH_PROFILE_BY_ID_QUERY": [({}, {"id": 1})],
+    "users.REGISTER_NEW_USER_QUERY": [
+        (
+            {},
+            {
+                "username": "new_user",
+                "email": "new_user@phresh.io",
+                "password": "password",
+                "salt": "salt",
+            },
+        )
+    ],
+    "users.UPDATE_USER_PASSWORD_QUERY": [
+        ({}, {"password": "password", "salt": "salt", "id": 1})
+    ],
+}
+
+
+def seq_scanned_tables(plan: Dict[str, Any]) -> Iterator[str]:
+    if plan["Node Type"] == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from seq_scanned_tables(child)
+
+
+class TestQueryPlans:
+    def test_every_repository_query_has_a_plan_case(self) -> None:
+        assert set(repository_queries()) == set(QUERY_CASES)
+
+    async def test_queries_on_large_tables_use_indexes(
+        self, app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        queries = repository_queries()
+        failures = []
+
+        # seed inside a transaction that is rolled back, so the other
+        # tests never see the extra rows
+        transaction = await db.transaction()
+        try:
+            for seed_query in SEED_QUERIES:
+                await db.execute(seed_query)
+
+            for key, cases in QUERY_CASES.items():
+                for template_kwargs, values in cases:
+                    query = queries[key].format(**template_kwargs)
+                    record = await db.fetch_one(
+                        query=f"EXPLAIN (FORMAT JSON) {query}", values=values
+                    )
+                    plan = record["QUERY PLAN"]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+
+                    scanned = set(seq_scanned_tables(plan[0]["Plan"])) & LARGE_TABLES
+                    if scanned and key not in FULL_SCAN_QUERIES:
+                        failures.append(f"{key} {template_kwargs}: {sorted(scanned)}")
+        finally:
+            await transaction.rollback()
+
+        assert not failures, "Seq Scan on large tables:\n" + "\n".join(failures)
@@ -0,0 +1,183 @@
+import time
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import pytest
+from databases import Database
+from fastapi import FastAPI, status
+from httpx import AsyncClient
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.api.dependencies.database import LAST_WRITE_COOKIE, get_reader_database
+from app.db.repositories.cleanings import GET_CLEANING_BY_ID_QUERY, CleaningsRepository
+from app.db.tasks import close_db_connection
+from app.models.cleaning import CleaningInDB
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_request(app: FastAPI, method: str, cookies: str = "") -> Request:
+    headers: List[Tuple[bytes, bytes]] = []
+    if cookies:
+        headers.append((b"cookie", cookies.encode()))
+    return Request({"type": "http", "method": method, "headers": headers, "app": app})
+
+
+class LaggingReplica:
+    """
+    A replica that hasn't caught up yet: every read gets back the row as
+    it was when the replica was created.
+    """
+
+    def __init__(self, record: Mapping) -> None:
+        self.record = record
+
+    async def fetch_one(self, query: str, values: Optional[Dict] = None) -> Mapping:
+        return self.record
+
+
+class ClosingDatabase:
+    def __init__(self, closed: List["ClosingDatabase"], *, fails: bool = False) -> None:
+        self.closed = closed
+        self.fails = fails
+
+    async def disconnect(self) -> None:
+        if self.fails:
+            raise ConnectionError("connection lost")
+        self.closed.append(self)
+
+
+@pytest.fixture
+def replicated_app(app: FastAPI) -> FastAPI:
+    app.state._db = Database("postgresql://primary/phresh")
+    app.state._replica_dbs = [Database("postgresql://replica/phresh")]
+    return app
+
+
+class TestReaderDatabase:
+    async def test_reads_go_to_primary_without_replicas(self, app: FastAPI) -> None:
+        app.state._db = Database("postgresql://primary/phresh")
+        app.state._replica_dbs = []
+        reader = get_reader_database(make_request(app, "GET"), Response())
+        assert reader is app.state._db
+
+    async def test_reads_go_to_a_replica(self, replicated_app: FastAPI) -> None:
+        reader = get_reader_database(make_request(replicated_app, "GET"), Response())
+        assert reader is replicated_app.state._replica_dbs[0]
+
+    async def test_writes_read_from_primary_and_mark_the_client(
+        self, replicated_app: FastAPI
+    ) -> None:
+        response = Response()
+        reader = get_reader_database(make_request(replicated_app, "POST"), response)
+        assert reader is replicated_app.state._db
+        assert LAST_WRITE_COOKIE in response.headers["set-cookie"]
+
+    @pytest.mark.parametrize("seconds_ago, reads_primary", ((1, True), (60, False)))
+    async def test_recent_writers_keep_reading_from_primary(
+        self, replicated_app: FastAPI, seconds_ago: int, reads_primary: bool
+    ) -> None:
+        cookies = f"{LAST_WRITE_COOKIE}={time.time() - seconds_ago}"
+        reader = get_reader_database(
+            make_request(replicated_app, "GET", cookies), Response()
+        )
+        assert (reader is replicated_app.state._db) == reads_primary
+
+
+class TestReplicaRouting:
+    async def test_repository_reads_use_the_reader_database(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        test_cleaning: CleaningInDB,
+    ) -> None:
+        unreachable = Database("postgresql://replica.invalid/phresh")
+        cleanings_repo = CleaningsRepository(unreachable, db)
+        page = await cleanings_repo.get_all_cleanings(limit=1)
+        assert page.cleanings
+
+    async def test_writes_set_the_last_write_cookie(
+        self, app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        # the test database stands in for a replica
+        app.state._replica_dbs = [db]
+        try:
+            res = await client.post(
+                app.url_path_for("cleanings:create-cleaning"),
+                json={
+                    "new_cleaning": {
+                        "name": "replicated",
+                        "price": 10,
+                        "cleaning_type": "dust_up",
+                    }
+                },
+            )
+        finally:
+            app.state._replica_dbs = []
+        assert res.status_code == status.HTTP_201_CREATED
+        assert LAST_WRITE_COOKIE in res.cookies
+
+
+class TestReplicasAndCaches:
+    async def test_lagging_replica_reads_are_not_cached(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        test_cleaning: CleaningInDB,
+    ) -> None:
+        url = app.url_path_for("cleanings:get-cleaning-by-id", id=test_cleaning.id)
+        stale_record = await db.fetch_one(
+            GET_CLEANING_BY_ID_QUERY, values={"id": test_cleaning.id}
+        )
+        app.state._replica_dbs = [LaggingReplica(stale_record)]
+        try:
+            res = await client.put(
+                app.url_path_for(
+                    "cleanings:update-cleaning-by-id", id=test_cleaning.id
+                ),
+                json={"cleaning_update": {"name": "caught up"}},
+            )
+            assert res.status_code == status.HTTP_200_OK
+
+            # other clients see the replica lag, but must not cache it
+            async with AsyncClient(app=app, base_url="http://testserver") as other:
+                res = await other.get(url)
+            assert res.json()["name"] == test_cleaning.name
+
+            res = await client.get(url)
+        finally:
+            app.state._replica_dbs = []
+        assert res.json()["name"] == "caught up"
+
+    async def test_recent_writers_skip_the_cache(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        test_cleaning: CleaningInDB,
+    ) -> None:
+        url = app.url_path_for("cleanings:get-cleaning-by-id", id=test_cleaning.id)
+        await client.get(url)
+
+        # written through another worker, whose commit can't drop the
+        # entry cached here
+        await db.execute(
+            "UPDATE cleanings SET name = 'renamed elsewhere' WHERE id = :id",
+            values={"id": test_cleaning.id},
+        )
+        res = await client.get(url, cookies={LAST_WRITE_COOKIE: str(time.time())})
+        assert res.json()["name"] == "renamed elsewhere"
+
+
+class TestCloseConnections:
+    async def test_replicas_are_closed_when_the_primary_fails_to(
+        self, app: FastAPI
+    ) -> None:
+        closed: List[ClosingDatabase] = []
+        app.state._db = ClosingDatabase(closed, fails=True)
+        app.state._replica_dbs = [ClosingDatabase(closed), ClosingDatabase(closed)]
+
+        await close_db_connection(app)
+        assert closed == app.state._replica_dbs
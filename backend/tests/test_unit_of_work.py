@@ -0,0 +1,142 @@
+from typing import Dict
+
+import pytest
+from databases import Database
+from fastapi import Depends, FastAPI, HTTPException, status
+from httpx import AsyncClient
+
+from app.api.dependencies.database import get_repository
+from app.core.metrics import collect_metrics
+from app.db.repositories.cleanings import CleaningsRepository
+from app.db.unit_of_work import call_on_commit
+from app.models.cleaning import CleaningCreate, CleaningInDB
+from app.models.user import UserInDB
+from app.services import auth_service
+from app.services.rate_limit import login_rate_limit_backend
+
+pytestmark = pytest.mark.asyncio
+
+COUNT_CLEANINGS_NAMED_QUERY = """
+    SELECT COUNT(*) AS count FROM cleanings WHERE name = :name
+"""
+
+# names passed to call_on_commit by the write_twice route
+committed: list = []
+
+
+def new_cleaning(name: str) -> CleaningCreate:
+    return CleaningCreate(name=name, price=10, cleaning_type="dust_up")
+
+
+@pytest.fixture
+def uow_app(app: FastAPI) -> FastAPI:
+    """
+    The app plus routes that write twice and then succeed or fail
+    """
+
+    @app.post("/uow/{name}/{outcome}/")
+    async def write_twice(
+        name: str,
+        outcome: str,
+        cleanings_repo: CleaningsRepository = Depends(
+            get_repository(CleaningsRepository)
+        ),
+    ) -> dict:
+        await cleanings_repo.create_cleaning(new_cleaning=new_cleaning(name))
+        await cleanings_repo.create_cleaning(new_cleaning=new_cleaning(name))
+        call_on_commit(committed.append, name)
+
+        if outcome == "http-error":
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+        if outcome == "crash":
+            raise RuntimeError("boom")
+        return {}
+
+    committed.clear()
+    return app
+
+
+async def count_cleanings(db: Database, name: str) -> int:
+    record = await db.fetch_one(COUNT_CLEANINGS_NAMED_QUERY, {"name": name})
+    return record["count"]
+
+
+class TestUnitOfWork:
+    async def test_successful_request_commits_every_write(
+        self, uow_app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        res = await client.post("/uow/uow-ok/ok/")
+        assert res.status_code == status.HTTP_200_OK
+        assert await count_cleanings(db, "uow-ok") == 2
+        assert committed == ["uow-ok"]
+
+    async def test_error_response_rolls_back_every_write(
+        self, uow_app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        res = await client.post("/uow/uow-http-error/http-error/")
+        assert res.status_code == status.HTTP_400_BAD_REQUEST
+        assert await count_cleanings(db, "uow-http-error") == 0
+        assert committed == []
+
+    async def test_exception_rolls_back_every_write(
+        self, uow_app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        with pytest.raises(RuntimeError):
+            await client.post("/uow/uow-crash/crash/")
+        assert await count_cleanings(db, "uow-crash") == 0
+        assert committed == []
+
+    async def test_request_checks_out_one_connection(
+        self, uow_app: FastAPI, client: AsyncClient, metrics_headers: Dict[str, str]
+    ) -> None:
+        metrics_url = uow_app.url_path_for("metrics:get-metrics")
+        res = await client.get(metrics_url, headers=metrics_headers)
+        acquired = res.json()["db_pool"]["acquire_ms"]["count"]
+
+        await client.post("/uow/uow-pinned/ok/")
+
+        res = await client.get(metrics_url, headers=metrics_headers)
+        assert res.json()["db_pool"]["acquire_ms"]["count"] == acquired + 1
+
+
+class TestLazyCheckout:
+    async def test_login_holds_no_connection_while_hashing(
+        self, app: FastAPI, client: AsyncClient, test_user: UserInDB, monkeypatch
+    ) -> None:
+        connections_in_use = []
+        verify_password_async = auth_service.verify_password_async
+
+        async def verify_and_count(**kwargs):
+            connections_in_use.append(collect_metrics()["db_pool"]["in_use"])
+            return await verify_password_async(**kwargs)
+
+        monkeypatch.setattr(auth_service, "verify_password_async", verify_and_count)
+        login_rate_limit_backend.clear()
+
+        client.headers["content-type"] = "application/x-www-form-urlencoded"
+        res = await client.post(
+            app.url_path_for("users:login-email-and-password"),
+            data={"username": test_user.email, "password": "testuserpassword"},
+        )
+        assert res.status_code == status.HTTP_200_OK
+        assert connections_in_use == [0]
+
+    async def test_cached_reads_check_out_no_connection(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        test_cleaning: CleaningInDB,
+        metrics_headers: Dict[str, str],
+    ) -> None:
+        url = app.url_path_for("cleanings:get-cleaning-by-id", id=test_cleaning.id)
+        metrics_url = app.url_path_for("metrics:get-metrics")
+        await client.get(url)
+
+        res = await client.get(metrics_url, headers=metrics_headers)
+        acquired = res.json()["db_pool"]["acquire_ms"]["count"]
+
+        res = await client.get(url)
+        assert res.status_code == status.HTTP_200_OK
+
+        res = await client.get(metrics_url, headers=metrics_headers)
+        assert res.json()["db_pool"]["acquire_ms"]["count"] == acquired
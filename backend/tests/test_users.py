@@ -1,5 +1,8 @@
+import asyncio
+import threading
+import time
 from builtins import BaseException
-from typing import List, Optional, Type, Union
+from typing import Dict, List, Optional, Type, Union
 
 import jwt
 import pytest
@@ -28,6 +31,20 @@ from app.db.repositories.users import UsersRepository
 from app.models.token import JWTCreds, JWTMeta, JWTPayload
 from app.models.user import UserCreate, UserInDB, UserPublic
 from app.services import auth_service
+from app.services.calibrate_password_hashing import measure_rounds, recommend_rounds
+from app.services.rate_limit import (
+    InMemoryRateLimitBackend,
+    TokenBucketLimiter,
+    login_limiter_by_email,
+    login_limiter_by_ip,
+    login_rate_limit_backend,
+)
+from app.services.authentication import (
+    PasswordHashPool,
+    make_password_context,
+    access_token_cache,
+    authenticated_users_cache,
+)
 
 pytestmark = pytest.mark.asyncio
 
@@ -43,6 +60,17 @@ class TestUserMe:
         assert user.username == test_user.username
         assert user.id == test_user.id
 
+    async def test_authenticated_user_is_served_from_cache(
+        self, app: FastAPI, authorized_client: AsyncClient, test_user: UserInDB
+    ) -> None:
+        await authorized_client.get(app.url_path_for("users:get-current-user"))
+        hits = authenticated_users_cache.hits
+
+        res = await authorized_client.get(app.url_path_for("users:get-current-user"))
+        assert res.status_code == HTTP_200_OK
+        assert UserPublic(**res.json()).id == test_user.id
+        assert authenticated_users_cache.hits == hits + 1
+
     async def test_user_cannot_access_own_data_if_not_authenticated(
         self, app: FastAPI, client: AsyncClient, test_user: UserInDB
     ) -> None:
@@ -72,6 +100,49 @@ class TestUserMe:
         assert res.status_code == HTTP_401_UNAUTHORIZED
 
 
+class TestUserLookups:
+    @pytest.mark.parametrize(
+        "lookup, attr",
+        (
+            ("get_user_by_email", "email"),
+            ("get_user_by_username", "username"),
+            ("get_user_by_id", "id"),
+        ),
+    )
+    async def test_populated_lookup_fetches_user_and_profile_in_one_query(
+        self,
+        client: AsyncClient,
+        db: Database,
+        test_user: UserInDB,
+        lookup: str,
+        attr: str,
+        monkeypatch,
+    ) -> None:
+        user_repo = UsersRepository(db)
+        fetch_one, queries = db.fetch_one, []
+
+        async def counting_fetch_one(*args, **kwargs):
+            queries.append(args or kwargs)
+            return await fetch_one(*args, **kwargs)
+
+        monkeypatch.setattr(db, "fetch_one", counting_fetch_one)
+
+        user = await getattr(user_repo, lookup)(**{attr: getattr(test_user, attr)})
+        assert len(queries) == 1
+        assert isinstance(user, UserPublic)
+        assert user.id == test_user.id
+        assert user.profile is not None
+        assert user.profile.user_id == test_user.id
+        assert user.profile == test_user.profile
+
+    async def test_unknown_user_lookup_returns_none(
+        self, client: AsyncClient, db: Database
+    ) -> None:
+        user_repo = UsersRepository(db)
+        assert await user_repo.get_user_by_id(id=999999) is None
+        assert await user_repo.get_user_by_id(id=999999, populate=False) is None
+
+
 class TestUserLogin:
     async def test_user_can_login_successfully_and_receives_valid_token(
         self,
@@ -141,6 +212,115 @@ class TestUserLogin:
         assert "access_token" not in res.json()
 
 
+class TestPasswordHashCost:
+    async def test_outdated_hash_is_replaced_on_successful_login(
+        self, app: FastAPI, client: AsyncClient, db: Database, test_user: UserInDB
+    ) -> None:
+        user_repo = UsersRepository(db)
+        user = await user_repo.get_user_by_email(email=test_user.email, populate=False)
+        cheap_context = make_password_context(schemes=["bcrypt"], rounds=4)
+        await db.execute(
+            "UPDATE users SET password = :password WHERE id = :id",
+            values={
+                "password": cheap_context.hash("testuserpassword" + user.salt),
+                "id": user.id,
+            },
+        )
+        user = await user_repo.get_user_by_email(email=test_user.email, populate=False)
+        assert auth_service.password_needs_rehash(hashed_pw=user.password)
+
+        client.headers["content-type"] = "application/x-www-form-urlencoded"
+        res = await client.post(
+            app.url_path_for("users:login-email-and-password"),
+            data={"username": test_user.email, "password": "testuserpassword"},
+        )
+        assert res.status_code == HTTP_200_OK
+
+        user = await user_repo.get_user_by_email(email=test_user.email, populate=False)
+        assert not auth_service.password_needs_rehash(hashed_pw=user.password)
+        assert auth_service.verify_password(
+            password="testuserpassword", salt=user.salt, hashed_pw=user.password
+        )
+
+    async def test_calibration_recommends_highest_cost_within_budget(self) -> None:
+        measurements = [
+            measure_rounds(scheme="bcrypt", rounds=rounds, samples=1)
+            for rounds in (4, 5)
+        ]
+        assert [m["rounds"] for m in measurements] == [4, 5]
+        assert all(m["hash_ms"] > 0 and m["verify_ms"] > 0 for m in measurements)
+
+        measurements = [
+            {"rounds": 10, "hash_ms": 60, "verify_ms": 60},
+            {"rounds": 11, "hash_ms": 120, "verify_ms": 120},
+            {"rounds": 12, "hash_ms": 240, "verify_ms": 240},
+        ]
+        assert recommend_rounds(measurements, target_ms=150) == 11
+        assert recommend_rounds(measurements, target_ms=50) is None
+
+
+class TestLoginThrottling:
+    @pytest.fixture(autouse=True)
+    def fresh_buckets(self):
+        login_rate_limit_backend.clear()
+        yield
+        login_rate_limit_backend.clear()
+
+    async def login(self, app: FastAPI, client: AsyncClient, email: str):
+        client.headers["content-type"] = "application/x-www-form-urlencoded"
+        return await client.post(
+            app.url_path_for("users:login-email-and-password"),
+            data={"username": email, "password": "wrongpassword"},
+        )
+
+    @pytest.mark.parametrize(
+        "limiter, emails",
+        (
+            (login_limiter_by_email, ["same@email.io"] * 3),
+            (login_limiter_by_ip, ["one@email.io", "two@email.io", "three@email.io"]),
+        ),
+    )
+    async def test_attempts_over_limit_are_rejected_before_authenticating(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        limiter: TokenBucketLimiter,
+        emails: List[str],
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr(limiter, "burst", 2)
+        monkeypatch.setattr(limiter, "per_minute", 1)
+        authenticate_user = UsersRepository.authenticate_user
+        attempts = []
+
+        async def counting_authenticate_user(self, **kwargs):
+            attempts.append(kwargs["email"])
+            return await authenticate_user(self, **kwargs)
+
+        monkeypatch.setattr(
+            UsersRepository, "authenticate_user", counting_authenticate_user
+        )
+
+        for email in emails[:2]:
+            res = await self.login(app, client, email)
+            assert res.status_code == HTTP_401_UNAUTHORIZED
+
+        res = await self.login(app, client, emails[2])
+        assert res.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert 0 < int(res.headers["Retry-After"]) <= 60
+        assert attempts == emails[:2]
+
+    async def test_bucket_refills_over_time(self, monkeypatch) -> None:
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now)
+        backend = InMemoryRateLimitBackend()
+        assert await backend.take("key", capacity=1, refill_per_second=0.5) == 0
+        assert await backend.take("key", capacity=1, refill_per_second=0.5) == 2
+
+        monkeypatch.setattr(time, "monotonic", lambda: now + 2)
+        assert await backend.take("key", capacity=1, refill_per_second=0.5) == 0
+
+
 class TestAuthTokens:
     async def test_can_retrieve_username_from_token(
         self, app: FastAPI, client: AsyncClient, test_user: UserInDB
@@ -153,6 +333,49 @@ class TestAuthTokens:
         )
         assert username == test_user.username
 
+    async def test_verified_token_is_served_from_cache(
+        self, app: FastAPI, client: AsyncClient, test_user: UserInDB, monkeypatch
+    ) -> None:
+        token = auth_service.create_access_token_for_user(
+            user=test_user, secret_key=str(SECRET_KEY)
+        )
+        auth_service.get_username_from_token(token=token, secret_key=str(SECRET_KEY))
+        hits = access_token_cache.hits
+
+        def fail_decode(*args, **kwargs):
+            raise AssertionError("cached token was decoded again")
+
+        monkeypatch.setattr(jwt, "decode", fail_decode)
+        username = auth_service.get_username_from_token(
+            token=token, secret_key=str(SECRET_KEY)
+        )
+        assert username == test_user.username
+        assert access_token_cache.hits == hits + 1
+
+    async def test_cached_token_is_checked_again_after_cache_is_cleared(
+        self, app: FastAPI, client: AsyncClient, test_user: UserInDB
+    ) -> None:
+        token = auth_service.create_access_token_for_user(
+            user=test_user, secret_key=str(SECRET_KEY)
+        )
+        auth_service.get_username_from_token(token=token, secret_key=str(SECRET_KEY))
+
+        auth_service.clear_access_token_cache()
+        misses = access_token_cache.misses
+        auth_service.get_username_from_token(token=token, secret_key=str(SECRET_KEY))
+        assert access_token_cache.misses == misses + 1
+
+    async def test_cached_token_is_not_trusted_under_another_secret(
+        self, app: FastAPI, client: AsyncClient, test_user: UserInDB
+    ) -> None:
+        token = auth_service.create_access_token_for_user(
+            user=test_user, secret_key=str(SECRET_KEY)
+        )
+        auth_service.get_username_from_token(token=token, secret_key=str(SECRET_KEY))
+
+        with pytest.raises(HTTPException):
+            auth_service.get_username_from_token(token=token, secret_key="rotated")
+
     @pytest.mark.parametrize(
         "secret, wrong_token",
         (
@@ -249,6 +472,40 @@ class TestAuthTokens:
             )
 
 
+class TestPasswordHashPool:
+    async def test_hashing_runs_off_the_event_loop(self) -> None:
+        pool = PasswordHashPool(max_workers=1, max_queue=0)
+        thread_name = await pool.run(lambda: threading.current_thread().name)
+        assert thread_name.startswith("password-hash")
+        assert thread_name != threading.current_thread().name
+
+    async def test_full_pool_rejects_new_work_immediately(self) -> None:
+        pool = PasswordHashPool(max_workers=1, max_queue=0)
+        release = threading.Event()
+        busy = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0)
+        assert pool.stats()["running"] == 1
+
+        with pytest.raises(HTTPException) as exc_info:
+            await pool.run(release.wait)
+        assert exc_info.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert exc_info.value.headers["Retry-After"] == "1"
+
+        release.set()
+        await busy
+        assert pool.stats()["rejected"] == 1
+        assert pool.stats()["running"] == 0
+
+    async def test_pool_usage_is_exposed_as_metrics(
+        self, app: FastAPI, client: AsyncClient, metrics_headers: Dict[str, str]
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("metrics:get-metrics"), headers=metrics_headers
+        )
+        assert res.status_code == HTTP_200_OK
+        assert {"workers", "queued", "rejected"} <= set(res.json()["password_hashing"])
+
+
 class TestUserRegistration:
     async def test_users_saved_password_is_hashed_and_has_salt(
         self,
@@ -355,6 +612,80 @@ class TestUserRegistration:
 
         assert res.status_code == status_code
 
+    async def test_taken_credentials_are_rejected_before_hashing(
+        self, app: FastAPI, client: AsyncClient, test_user: UserInDB, monkeypatch
+    ) -> None:
+        async def hash_password(**kwargs):
+            raise AssertionError("password hashed for a taken email")
+
+        monkeypatch.setattr(
+            auth_service, "create_salt_and_hashed_password_async", hash_password
+        )
+        new_user = {
+            "email": test_user.email,
+            "username": "brand_new_username",
+            "password": "freepassword",
+        }
+        res = await client.post(
+            app.url_path_for("users:register-new-user"), json={"new_user": new_user}
+        )
+        assert res.status_code == HTTP_400_BAD_REQUEST
+
+    async def test_registration_race_is_caught_by_unique_index(
+        self, app: FastAPI, client: AsyncClient, test_user: UserInDB, monkeypatch
+    ) -> None:
+        # another sign up took the email between the check and the insert
+        monkeypatch.setattr(
+            "app.db.repositories.users.CHECK_USER_CREDENTIALS_TAKEN_QUERY",
+            "SELECT :email = '' AS email_taken, :username = '' AS username_taken",
+        )
+        new_user = {
+            "email": test_user.email,
+            "username": "brand_new_username",
+            "password": "freepassword",
+        }
+        res = await client.post(
+            app.url_path_for("users:register-new-user"), json={"new_user": new_user}
+        )
+        assert res.status_code == HTTP_400_BAD_REQUEST
+        assert res.json()["detail"].startswith("That email is already taken.")
+
+    async def test_registration_with_taken_username_creates_nothing(
+        self, app: FastAPI, client: AsyncClient, db: Database, test_user: UserInDB
+    ) -> None:
+        new_user = {
+            "email": "never@created.io",
+            "username": test_user.username,
+            "password": "freepassword",
+        }
+        res = await client.post(
+            app.url_path_for("users:register-new-user"), json={"new_user": new_user}
+        )
+        assert res.status_code == HTTP_400_BAD_REQUEST
+        assert res.json()["detail"] == (
+            "That username is already taken. Please try another one."
+        )
+
+        user_repo = UsersRepository(db)
+        assert await user_repo.get_user_by_email(email=new_user["email"]) is None
+
+    async def test_registration_returns_user_with_profile(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        new_user = {
+            "email": "with@profile.io",
+            "username": "withprofile",
+            "password": "freepassword",
+        }
+        res = await client.post(
+            app.url_path_for("users:register-new-user"), json={"new_user": new_user}
+        )
+        assert res.status_code == HTTP_201_CREATED
+        created_user = UserPublic(**res.json())
+        assert created_user.profile is not None
+        assert created_user.profile.user_id == created_user.id
+        assert created_user.access_token is not None
+
 
 class TestUserRoutes:
     async def test_routes_exist(self, app: FastAPI, client: AsyncClient) -> None:
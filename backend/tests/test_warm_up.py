@@ -0,0 +1,82 @@
+import logging
+
+import pytest
+from asgi_lifespan import LifespanManager
+from databases import Database
+from fastapi import FastAPI, status
+from httpx import AsyncClient
+
+from app.db.warm_up import repository_queries, warm_up_database
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestWarmUp:
+    async def test_app_is_ready_once_started(
+        self, app: FastAPI, client: AsyncClient
+    ) -> None:
+        res = await client.get(app.url_path_for("health:get-readiness"))
+        assert res.status_code == status.HTTP_200_OK
+        assert res.json() == {"ready": True}
+
+    async def test_app_is_not_ready_before_startup(self, app: FastAPI) -> None:
+        # no lifespan, so startup and its warm up never ran
+        async with AsyncClient(app=app, base_url="http://testserver") as client:
+            res = await client.get(app.url_path_for("health:get-readiness"))
+        assert res.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert res.json() == {"ready": False}
+
+    async def test_every_complete_statement_is_prepared_on_each_connection(
+        self, app: FastAPI, client: AsyncClient, db: Database
+    ) -> None:
+        statements = [q for q in repository_queries().values() if "{" not in q]
+        min_size = db._backend._pool.get_min_size()
+        assert await warm_up_database(db) == len(statements) * min_size
+        assert db._backend._pool.get_size() >= min_size
+
+    async def test_statements_that_fail_to_prepare_are_skipped(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        db: Database,
+        caplog: pytest.LogCaptureFixture,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setattr(
+            "app.db.warm_up.repository_queries",
+            lambda: {
+                "test.GOOD_QUERY": "SELECT 1",
+                "test.BROKEN_QUERY": "SELECT * FROM no_such_table",
+            },
+        )
+        with caplog.at_level(logging.WARNING, logger="app.db.warm_up"):
+            prepared = await warm_up_database(db)
+
+        assert prepared == db._backend._pool.get_min_size()
+        assert "Could not prepare test.BROKEN_QUERY" in caplog.text
+
+    async def test_app_is_ready_even_if_warm_up_fails(
+        self, app: FastAPI, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        async def fail_to_warm_up(database: Database) -> int:
+            raise ConnectionError("replica went away")
+
+        monkeypatch.setattr("app.core.tasks.warm_up_database", fail_to_warm_up)
+        async with LifespanManager(app):
+            async with AsyncClient(app=app, base_url="http://testserver") as client:
+                res = await client.get(app.url_path_for("health:get-readiness"))
+        assert res.status_code == status.HTTP_200_OK
+        assert res.json() == {"ready": True}
+
+    async def test_app_is_not_ready_without_the_primary_database(
+        self, app: FastAPI, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        async def fail_to_connect(*args, **kwargs) -> Database:
+            raise ConnectionError("database is down")
+
+        monkeypatch.setattr("app.db.tasks.connect_database", fail_to_connect)
+        async with LifespanManager(app):
+            async with AsyncClient(app=app, base_url="http://testserver") as client:
+                res = await client.get(app.url_path_for("health:get-readiness"))
+        assert res.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert res.json() == {"ready": False}